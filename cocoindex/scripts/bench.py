@@ -0,0 +1,608 @@
+"""インデックス構築・検索のベンチマーク
+
+embedding API の料金・レート制限に左右されない再現可能な基準値を JSON で出力する
+（リリース間で diff できるよう、計測値以外の項目は入力が同じなら同じになる）。
+
+使い方:
+  uv run python bench.py index [--corpus DIR] [--files 500] [--embed-latency-ms 30] [--output report.json]
+  uv run python bench.py search [--rows 10000,100000,1000000] [--top 5,10,50] [--queries 50] [--output report.json]
+
+index: ローカルの疑似 embedding サーバー（Ollama 互換、決定的なベクトルを返す）に対して
+合成コーパスまたは指定ディレクトリをインデックスし、所要時間の内訳を計測する。
+  walk      対象ファイルの列挙（file_source.FileIndex の走査）
+  chunking  言語判定 + チャンク分割（transform_flow で1ファイルずつ評価した合計）
+  update    flow.update() 全体（walk・chunking・embedding・DB書き込みを含む）
+  embedding 疑似サーバーが受けたリクエスト数・バッチサイズ・処理中だった時間
+  db        update のうち embedding 待ちと重ならない時間（≒ チャンク分割 + DB書き込み）、テーブルサイズ
+
+search: cocoindex_bench_search_<rows> に合成チャンク（halfvec）を投入し、
+search.py の vector_search のレイテンシ（p50/p95/p99）を計測する。テーブル名は codeindex_ で始めないため、
+計測中も search.py --project-glob・maintenance.py --all・embedding_store.py gc の対象にならない。
+  exact     全チャンクとの距離を計算する厳密検索（--exact）
+  knn       近傍チャンクを取得してファイル単位に重複排除する通常の検索（HNSW 作成前 = 逐次走査）
+  knn+hnsw  HNSW インデックス作成後の通常の検索
+  binary+hnsw  halfvec の HNSW を二値量子化の HNSW に置き換えた2段階検索（pgvector 0.7 以降）
+  *+filter  --filter-prefix（デフォルトは全ファイルの1%）で絞り込んだ検索（search.py --path-prefix）。
+            knn+hnsw+filter は HNSW のみ、knn+hnsw+filter+btree は filename の btree インデックス作成後
+exact を計測した行数では、各条件の exact（+filter）に対する再現率（上位ファイルの一致率）も出力する。
+"""
+import argparse
+import dataclasses
+import hashlib
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BENCH_SEARCH_TABLE_PREFIX = "cocoindex_bench_search_"  # インデックステーブル（codeindex_*）と区別する
+BENCH_INDEX_FLOW_PREFIX = "CocoIndexBench_"  # テーブルは cocoindexbench_<id>__code_chunks
+
+RUBY_TEMPLATE = """class {cls}
+  def initialize({arg})
+    @{arg} = {arg}
+  end
+{methods}end
+"""
+RUBY_METHOD = """
+  def {name}({arg})
+    return nil if {arg}.nil?
+
+    @{field} = {arg}.map {{ |item| item.to_s.strip }}.reject(&:empty?)
+    @{field}.each_with_index do |value, index|
+      log("{cls}#{name}", index, value)
+    end
+  end
+"""
+PYTHON_TEMPLATE = """import logging
+
+logger = logging.getLogger(__name__)
+
+
+class {cls}:
+    def __init__(self, {arg}):
+        self.{arg} = {arg}
+{methods}"""
+PYTHON_METHOD = """
+    def {name}(self, {arg}):
+        if {arg} is None:
+            return None
+        self.{field} = [str(item).strip() for item in {arg} if str(item).strip()]
+        for index, value in enumerate(self.{field}):
+            logger.debug("{cls}.{name} %s %s", index, value)
+        return self.{field}
+"""
+
+WORDS = ["user", "order", "invoice", "payment", "account", "session", "token", "report", "item", "cart",
+         "shipment", "address", "profile", "message", "event", "schedule", "price", "discount", "stock", "review"]
+
+
+# --- 疑似 embedding サーバー ---
+
+
+@dataclasses.dataclass
+class EmbedRequest:
+    started: float
+    finished: float
+    batch_size: int
+
+
+class FakeEmbeddingServer:
+    """Ollama の /api/embed 互換サーバー（テキストの sha256 から決定的なベクトルを返す）"""
+
+    def __init__(self, dim: int, latency_ms: float = 0.0, rate_limit_ratio: float = 0.0):
+        self.dim = dim
+        self.latency = latency_ms / 1000
+        self.rate_limit_ratio = rate_limit_ratio
+        self.requests: list[EmbedRequest] = []
+        self.rate_limited = 0
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                started = time.perf_counter()
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                with server._lock:
+                    limited = server._random.random() < server.rate_limit_ratio
+                    server.rate_limited += limited
+                if limited:
+                    self.send_response(429)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+                payload = json.dumps({"embeddings": [server.vector(t) for t in texts]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with server._lock:
+                    server.requests.append(EmbedRequest(started, time.perf_counter(), len(texts)))
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.address = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def vector(self, text: str) -> list[float]:
+        digest = hashlib.sha256(text.encode()).digest()
+        return [(digest[i % len(digest)] - 128) / 128 for i in range(self.dim)]
+
+    def start(self) -> None:
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def summary(self) -> dict:
+        sizes = [r.batch_size for r in self.requests]
+        return {
+            "requests": len(sizes),
+            "texts": sum(sizes),
+            "batch_size": {
+                "min": min(sizes, default=0),
+                "mean": statistics.fmean(sizes) if sizes else 0.0,
+                "max": max(sizes, default=0),
+            },
+            "busy_seconds": busy_seconds([(r.started, r.finished) for r in self.requests]),
+            "max_concurrency": max_concurrency([(r.started, r.finished) for r in self.requests]),
+            "rate_limited": self.rate_limited,
+        }
+
+
+def busy_seconds(intervals: list[tuple[float, float]]) -> float:
+    """区間の和集合の長さ（並行リクエストを重複して数えない）"""
+    total = 0.0
+    end = float("-inf")
+    for start, finish in sorted(intervals):
+        if finish <= end:
+            continue
+        total += finish - max(start, end)
+        end = finish
+    return total
+
+
+def max_concurrency(intervals: list[tuple[float, float]]) -> int:
+    """同時に処理していたリクエスト数の最大値"""
+    events = sorted([(start, 1) for start, _ in intervals] + [(finish, -1) for _, finish in intervals])
+    current = peak = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+# --- コーパス ---
+
+
+def generate_corpus(dest: Path, files: int, seed: int) -> None:
+    """Ruby/Python のクラス定義からなる合成コーパスを作成（seed が同じなら同じ内容）"""
+    rng = random.Random(seed)
+    for i in range(files):
+        cls = "".join(w.capitalize() for w in rng.sample(WORDS, 2)) + str(i)
+        arg = rng.choice(WORDS)
+        ruby = i % 5 < 3
+        method_template = RUBY_METHOD if ruby else PYTHON_METHOD
+        methods = "".join(
+            method_template.format(
+                cls=cls, name=f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{m}",
+                arg=rng.choice(WORDS), field=rng.choice(WORDS),
+            )
+            for m in range(rng.randint(2, 12))
+        )
+        template = RUBY_TEMPLATE if ruby else PYTHON_TEMPLATE
+        path = dest / f"pkg{i % 20}" / (f"{cls.lower()}.rb" if ruby else f"{cls.lower()}.py")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(template.format(cls=cls, arg=arg, methods=methods))
+
+
+def time_chunking(files: list[Path], root: Path, profiles: dict) -> tuple[float, int]:
+    """言語判定 + チャンク分割だけを1ファイルずつ評価し、合計時間とチャンク数を返す"""
+    import cocoindex
+
+    import chunk_profiles
+
+    @dataclasses.dataclass
+    class Chunk:
+        text: str
+
+    @cocoindex.transform_flow()
+    def split(filename: cocoindex.DataSlice[str], content: cocoindex.DataSlice[str]) -> cocoindex.DataSlice[dict[cocoindex.Range, Chunk]]:
+        language = filename.transform(cocoindex.functions.DetectProgrammingLanguage())
+        profile = language.transform(chunk_profiles.SelectChunkProfile(profiles=profiles))
+        return content.transform(
+            cocoindex.functions.SplitRecursively(),
+            language=profile["language"],
+            chunk_size=profile["chunk_size"],
+            min_chunk_size=profile["min_chunk_size"],
+            chunk_overlap=profile["chunk_overlap"],
+        )
+
+    chunks = 0
+    started = time.perf_counter()
+    for path in files:
+        content = path.read_text(errors="replace")
+        chunks += len(split.eval(path.relative_to(root).as_posix(), content))
+    return time.perf_counter() - started, chunks
+
+
+# --- index ---
+
+
+def bench_index(args) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="cocoindex-bench-"))
+    if args.corpus:
+        corpus = Path(args.corpus).resolve()
+    else:
+        corpus = workdir / "corpus"
+        generate_corpus(corpus, args.files, args.seed)
+
+    dim = args.dim
+    run_id = uuid.uuid4().hex[:8]
+    server = FakeEmbeddingServer(dim, args.embed_latency_ms, args.rate_limit_ratio)
+    server.start()
+    os.environ.update({
+        "EMBEDDING_PROVIDER": "ollama",
+        "EMBEDDING_MODEL": f"bench-{run_id}",
+        "EMBEDDING_ADDRESS": server.address,
+        "EMBEDDING_STORE": "off" if args.no_store else "on",
+    })
+    for option, name in [("embed_batch_size", "EMBEDDING_BATCH_SIZE"), ("embed_concurrency", "EMBEDDING_CONCURRENCY"),
+                         ("embed_tpm", "EMBEDDING_TPM")]:
+        if getattr(args, option) is not None:
+            os.environ[name] = str(getattr(args, option))
+
+    import cocoindex
+    import psycopg2
+
+    import chunk_profiles
+    import embedding_limiter
+    import embedding_store
+    import embeddings
+    import file_source
+    import main as indexer
+
+    included = [p.strip() for p in args.patterns.split(",")]
+    excluded = list(indexer.DEFAULT_EXCLUDES)
+    profiles = chunk_profiles.load_profiles(args.chunk_profiles)
+
+    started = time.perf_counter()
+    file_index = file_source.FileIndex(str(corpus), included, excluded)
+    file_index.scan()
+    files = [corpus / rel for rel in file_index.files]
+    walk_seconds = time.perf_counter() - started
+    source_bytes = sum(p.stat().st_size for p in files)
+
+    cocoindex.init()
+    chunking_seconds, chunk_count = time_chunking(files, corpus, profiles)
+
+    # テーブルを codeindex_ で始めず、計測中・--keep 後も store の参照数・maintenance.py --all・検索の対象にしない
+    flow, flow_name = indexer.create_flow(str(corpus), f"bench_{run_id}", included, excluded, profiles=profiles,
+                                          flow_name=f"{BENCH_INDEX_FLOW_PREFIX}{run_id}")
+    table_name = indexer.derive_table_name(flow_name)
+    flow.setup()
+    started = time.perf_counter()
+    flow.update()
+    update_seconds = time.perf_counter() - started
+    embedding = server.summary()
+    server.stop()
+    limiter = embedding_limiter.get_limiter()
+
+    conn = psycopg2.connect(embedding_store.get_database_url())
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f'SELECT count(*), pg_total_relation_size(%s) FROM "{table_name}"', (table_name,))
+            rows, table_bytes = cur.fetchone()
+            if not args.no_store:
+                # ストアのキーは EMBEDDING_DIMENSION（.env）を含むため、フローと同じ関数で作る
+                cur.execute(
+                    f"DELETE FROM {embedding_store.STORE_TABLE} WHERE model = %s",
+                    (embeddings.model_key("ollama", os.environ["EMBEDDING_MODEL"], embeddings.get_dimension()),),
+                )
+        conn.commit()
+    finally:
+        conn.close()
+
+    if not args.keep:
+        flow.drop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "benchmark": "index",
+        "corpus": {"path": str(corpus) if args.corpus else None, "files": len(files), "bytes": source_bytes, "seed": args.seed},
+        "config": {
+            "embed_latency_ms": args.embed_latency_ms,
+            "dim": dim,
+            "embedding_store": not args.no_store,
+            "embed_batch_size": limiter.batch_size,
+            "embed_concurrency": limiter.concurrency,
+            "embed_tpm": limiter.tpm,
+            "rate_limit_ratio": args.rate_limit_ratio,
+            "profiles": profiles,
+        },
+        "walk": {"seconds": walk_seconds, "discovery": file_index.discovery},
+        "chunking": {"seconds": chunking_seconds, "chunks": chunk_count},
+        "update": {
+            "seconds": update_seconds,
+            "files_per_second": len(files) / update_seconds if update_seconds else 0.0,
+            "chunks_per_second": rows / update_seconds if update_seconds else 0.0,
+        },
+        "embedding": embedding,
+        "limiter": limiter.stats,
+        "db": {
+            "rows": rows,
+            "table_bytes": table_bytes,
+            "non_embedding_seconds": max(update_seconds - embedding["busy_seconds"], 0.0),
+        },
+        "table": table_name if args.keep else None,
+    }
+
+
+# --- search ---
+
+
+def percentiles(samples: list[float]) -> dict:
+    """ミリ秒のサンプルから p50/p95/p99・平均を返す"""
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": cuts[49],
+        "p95_ms": cuts[94],
+        "p99_ms": cuts[98],
+        "mean_ms": statistics.fmean(samples),
+    }
+
+
+def populate_table(conn, table_name: str, rows: int, dim: int, chunks_per_file: int, seed: int,
+                   batch: int = 50_000) -> float:
+    """code_chunks と同じ列構成のテーブルを作り、疑似乱数の embedding の行を投入（秒数を返す）
+
+    embedding の各要素は (seed, 行番号, 次元) のハッシュから決めるため、同じ --seed なら毎回同じ値になる
+    （random() は setseed しても実行順に依存する）。
+    """
+    from psycopg2 import sql
+
+    table = sql.Identifier(table_name)
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(table))
+        cur.execute(sql.SQL("""
+            CREATE TABLE {} (
+                generated_id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+                filename text, language text, chunk_text text,
+                start_line bigint, end_line bigint, start_offset bigint, end_offset bigint,
+                content_hash text, embedding halfvec({})
+            )
+        """).format(table, sql.Literal(dim)))
+        for offset in range(0, rows, batch):
+            # 行ごとに別のベクトルになるよう、要素を i と次元 d のハッシュ（[-0.5, 0.5)）にする
+            cur.execute(sql.SQL("""
+                INSERT INTO {} (filename, language, chunk_text, start_line, end_line,
+                                start_offset, end_offset, content_hash, embedding)
+                SELECT format('src/pkg%%s/file%%s.rb', (i / %(cpf)s) %% 100, i / %(cpf)s), 'ruby',
+                       format('def method_%%s; end', i), (i %% %(cpf)s) * 20 + 1, (i %% %(cpf)s) * 20 + 20,
+                       (i %% %(cpf)s) * 600, (i %% %(cpf)s) * 600 + 800, md5(i::text),
+                       (SELECT array_agg((hashtextextended(i || ':' || d, %(seed)s) & 4294967295) / 4294967296.0 - 0.5 ORDER BY d)
+                        FROM generate_series(1, %(dim)s) d)::real[]::halfvec
+                FROM generate_series(%(start)s, %(stop)s) i
+            """).format(table), {"cpf": chunks_per_file, "dim": dim, "seed": seed, "start": offset, "stop": min(offset + batch, rows) - 1})
+            conn.commit()
+            print(f"[bench] {table_name}: {min(offset + batch, rows)}/{rows} rows", file=sys.stderr)
+        cur.execute(sql.SQL("ANALYZE {}").format(table))
+    conn.commit()
+    return time.perf_counter() - started
+
+
+def create_index(conn, table_name: str, suffix: str, definition: str) -> dict:
+    """インデックスを作成し、作成秒数とサイズを返す"""
+    from psycopg2 import sql
+
+    index_name = f"{table_name[:63 - len(suffix) - 1]}_{suffix}"
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("CREATE INDEX {} ON {} USING " + definition).format(
+            sql.Identifier(index_name), sql.Identifier(table_name),
+        ))
+        build_seconds = time.perf_counter() - started
+        cur.execute("SELECT pg_relation_size(%s)", (index_name,))
+        index_bytes = cur.fetchone()[0]
+    conn.commit()
+    return {"name": index_name, "build_seconds": build_seconds, "bytes": index_bytes}
+
+
+def create_hnsw_index(conn, table_name: str) -> dict:
+    """main.py のフローと同じ HNSW（コサイン距離）インデックスを作成"""
+    return create_index(conn, table_name, "hnsw", "hnsw (embedding halfvec_cosine_ops)")
+
+
+def create_binary_index(conn, table_name: str, dim: int) -> dict:
+    """main.py の binary_index_command と同じ二値量子化の HNSW インデックスを作成"""
+    return create_index(conn, table_name, "bq", f"hnsw ((binary_quantize(embedding)::bit({dim})) bit_hamming_ops)")
+
+
+def supports_binary_quantize(conn) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cur.fetchone()
+    conn.rollback()
+    return row is not None and tuple(int(x) for x in row[0].split(".")[:2]) >= (0, 7)
+
+
+def measure_queries(conn, table_name: str, vectors: list[list[float]], top: int, warmup: int,
+                    expected: list[list[str]] | None = None, **options) -> tuple[dict, list[list[str]]]:
+    """レイテンシを計測し、クエリごとの上位ファイル名も返す（expected があれば再現率を計算）"""
+    from search import vector_search
+
+    samples = []
+    found = []
+    for i, vec in enumerate(vectors):
+        started = time.perf_counter()
+        results = list(vector_search(conn, [table_name], vec, top, **options))
+        conn.rollback()
+        if i >= warmup:
+            samples.append((time.perf_counter() - started) * 1000)
+            found.append([r["filename"] for r in results])
+
+    report = percentiles(samples)
+    if expected is not None:
+        report["recall"] = statistics.fmean(
+            len(set(f) & set(e)) / len(e) if e else 1.0 for f, e in zip(found, expected)
+        )
+    return report, found
+
+
+def bench_search(args) -> dict:
+    import psycopg2
+
+    from search import DEFAULT_RERANK_FACTOR, get_database_url
+
+    rng = random.Random(args.seed)
+    tops = [int(t) for t in args.top.split(",")]
+    vectors = [[rng.random() - 0.5 for _ in range(args.dim)] for _ in range(args.queries + args.warmup)]
+
+    conn = psycopg2.connect(get_database_url())
+    tables = []
+    try:
+        for rows in (int(r) for r in args.rows.split(",")):
+            table_name = f"{BENCH_SEARCH_TABLE_PREFIX}{rows}"
+            populate_seconds = populate_table(conn, table_name, rows, args.dim, args.chunks_per_file, args.seed)
+            table_report = {"rows": rows, "table": table_name, "populate_seconds": populate_seconds, "results": []}
+
+            expected: dict[tuple[bool, int], list[list[str]]] = {}
+
+            def run(variant: str, **options):
+                for top in tops:
+                    print(f"[bench] {table_name}: {variant} top={top}", file=sys.stderr)
+                    key = (bool(options.get("filters")), top)
+                    report, found = measure_queries(
+                        conn, table_name, vectors, top, args.warmup, expected.get(key), **options,
+                    )
+                    if variant.startswith("exact"):
+                        expected[key] = found
+                    table_report["results"].append({"variant": variant, "top": top, **report})
+
+            if rows <= args.exact_max_rows:
+                run("exact", exact=True)
+            run("knn", overfetch=args.overfetch, ef_search=args.ef_search)
+            hnsw = create_hnsw_index(conn, table_name)
+            table_report["index_build_seconds"] = hnsw["build_seconds"]
+            table_report["hnsw_index_bytes"] = hnsw["bytes"]
+            run("knn+hnsw", overfetch=args.overfetch, ef_search=args.ef_search)
+
+            filters = {"path_prefix": [args.filter_prefix]}
+            if rows <= args.exact_max_rows:
+                run("exact+filter", exact=True, filters=filters)
+            run("knn+hnsw+filter", overfetch=args.overfetch, ef_search=args.ef_search, filters=filters)
+            path = create_index(conn, table_name, "path", "btree (filename text_pattern_ops)")
+            with conn.cursor() as cur:
+                cur.execute(f'ANALYZE "{table_name}"')
+            conn.commit()
+            table_report["path_index_bytes"] = path["bytes"]
+            run("knn+hnsw+filter+btree", overfetch=args.overfetch, ef_search=args.ef_search, filters=filters)
+
+            if supports_binary_quantize(conn):
+                with conn.cursor() as cur:
+                    cur.execute(f'DROP INDEX "{hnsw["name"]}"')
+                conn.commit()
+                binary = create_binary_index(conn, table_name, args.dim)
+                table_report["binary_index_build_seconds"] = binary["build_seconds"]
+                table_report["binary_index_bytes"] = binary["bytes"]
+                run("binary+hnsw", overfetch=args.overfetch, ef_search=args.ef_search)
+            else:
+                print("[bench] pgvector < 0.7: skipping binary+hnsw", file=sys.stderr)
+
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_table_size(%s)", (table_name,))
+                table_report["table_bytes"] = cur.fetchone()[0]
+                if not args.keep:
+                    cur.execute(f'DROP TABLE "{table_name}"')
+            conn.commit()
+            tables.append(table_report)
+    finally:
+        conn.close()
+
+    return {
+        "benchmark": "search",
+        "config": {
+            "dim": args.dim,
+            "queries": args.queries,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "chunks_per_file": args.chunks_per_file,
+            "overfetch": args.overfetch,
+            "ef_search": args.ef_search,
+            "rerank_factor": int(os.environ.get("SEARCH_RERANK_FACTOR", DEFAULT_RERANK_FACTOR)),
+            "filter_prefix": args.filter_prefix,
+        },
+        "tables": tables,
+    }
+
+
+def write_report(report: dict, output: str | None) -> None:
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        Path(output).write_text(text + "\n")
+    print(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="インデックス構築・検索のベンチマーク")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index = subparsers.add_parser("index", help="疑似 embedding サーバーに対して flow.update() を計測")
+    index.add_argument("--corpus", default=None, help="インデックス対象ディレクトリ（未指定時は合成コーパス）")
+    index.add_argument("--files", type=int, default=500, help="合成コーパスのファイル数（デフォルト: 500）")
+    index.add_argument("--seed", type=int, default=0, help="合成コーパスの乱数シード")
+    index.add_argument("--patterns", default="**/*.rb,**/*.py", help="対象ファイルパターン（カンマ区切り）")
+    index.add_argument("--chunk-profiles", default=None, help="言語ごとのチャンク設定（main.py と同じ JSON）")
+    index.add_argument("--embed-latency-ms", type=float, default=0.0, help="疑似サーバーの1リクエストあたりの遅延")
+    index.add_argument("--dim", type=int, default=1024, help="embedding の次元数（デフォルト: 1024）")
+    index.add_argument("--no-store", action="store_true", help="embeddingストアを使わずに全チャンクを embedding する")
+    index.add_argument("--embed-batch-size", type=int, default=None, help="main.py --embed-batch-size と同じ")
+    index.add_argument("--embed-concurrency", type=int, default=None, help="main.py --embed-concurrency と同じ")
+    index.add_argument("--embed-tpm", type=int, default=None, help="main.py --embed-tpm と同じ")
+    index.add_argument("--rate-limit-ratio", type=float, default=0.0,
+                       help="疑似サーバーが 429 を返すリクエストの割合（バックオフの確認用、デフォルト: 0）")
+    index.add_argument("--keep", action="store_true", help="計測後にテーブルと合成コーパスを削除しない")
+    index.add_argument("--output", default=None, help="JSON レポートの保存先（標準出力にも出力）")
+
+    search = subparsers.add_parser("search", help="合成テーブルで exact / knn / knn+hnsw / binary+hnsw の検索レイテンシと再現率を計測")
+    search.add_argument("--rows", default="10000,100000", help="テーブルの行数（カンマ区切り、例: 10000,100000,1000000,5000000）")
+    search.add_argument("--top", default="5,10,50", help="計測する --top の値（カンマ区切り）")
+    search.add_argument("--queries", type=int, default=50, help="1条件あたりの計測クエリ数（デフォルト: 50）")
+    search.add_argument("--warmup", type=int, default=5, help="計測前に捨てるクエリ数（デフォルト: 5）")
+    search.add_argument("--dim", type=int, default=1024, help="embedding の次元数（デフォルト: 1024）")
+    search.add_argument("--chunks-per-file", type=int, default=8, help="1ファイルあたりのチャンク数（重複排除の効き方に影響）")
+    search.add_argument("--overfetch", type=int, default=None, help="search.py --overfetch と同じ")
+    search.add_argument("--ef-search", type=int, default=None, help="search.py --ef-search と同じ")
+    search.add_argument("--filter-prefix", default="src/pkg7/",
+                        help="*+filter で使う --path-prefix（デフォルト: src/pkg7/ = 全ファイルの1%%）")
+    search.add_argument("--exact-max-rows", type=int, default=1_000_000, help="exact を計測する最大行数（デフォルト: 1000000）")
+    search.add_argument("--seed", type=int, default=0, help="クエリベクトル・合成行の embedding の乱数シード")
+    search.add_argument("--keep", action="store_true", help="計測後にテーブルを削除しない")
+    search.add_argument("--output", default=None, help="JSON レポートの保存先（標準出力にも出力）")
+
+    args = parser.parse_args()
+    if args.command == "index":
+        write_report(bench_index(args), args.output)
+    elif args.command == "search":
+        write_report(bench_search(args), args.output)
+    else:
+        sys.exit(f"unknown command: {args.command}")
+
+
+if __name__ == "__main__":
+    main()
@@ -36,18 +36,12 @@ TABLE_NAME=$(echo "$TABLE_NAME" | tr '[:upper:]' '[:lower:]')
 
 HAS_ERROR=0
 
-# --- 1. PostgreSQL接続確認 ---
-PG_CHECK=$(cd "$SCRIPT_DIR" && uv run python -c "
-import psycopg2
-try:
-    conn = psycopg2.connect('$DB_URL', connect_timeout=3)
-    conn.close()
-    print('ok')
-except Exception:
-    print('fail')
-" 2>/dev/null)
+# --- PostgreSQL接続・インデックスを1プロセスで確認 ---
+PREFLIGHT=$(cd "$SCRIPT_DIR" && uv run python preflight.py --project-dir "$PROJECT_DIR" --count --format shell 2>/dev/null || true)
+eval "$PREFLIGHT"
 
-if [[ "$PG_CHECK" == "ok" ]]; then
+# --- 1. PostgreSQL接続確認 ---
+if [[ "${PREFLIGHT_DATABASE:-}" == "ok" ]]; then
   echo "OK: PostgreSQL is running ($DB_URL)"
 else
   echo "NG: PostgreSQL is not reachable ($DB_URL)"
@@ -56,35 +50,26 @@ else
 fi
 
 # --- 2. 現プロジェクトのインデックス確認 ---
-if [[ "$PG_CHECK" == "ok" ]]; then
+if [[ "${PREFLIGHT_DATABASE:-}" == "ok" ]]; then
   echo ""
   echo "Project: ${PROJECT_NAME}"
   echo "Table:   ${TABLE_NAME}"
 
-  RESULT=$(cd "$SCRIPT_DIR" && uv run python -c "
-import psycopg2
-conn = psycopg2.connect('$DB_URL', connect_timeout=3)
-cur = conn.cursor()
-cur.execute(\"SELECT EXISTS(SELECT 1 FROM pg_tables WHERE tablename = '${TABLE_NAME}')\")
-exists = cur.fetchone()[0]
-if exists:
-    cur.execute('SELECT count(*) FROM \"${TABLE_NAME}\"')
-    count = cur.fetchone()[0]
-    print(f'ok:{count}')
-else:
-    print('notfound')
-conn.close()
-" 2>/dev/null || echo "error")
-
-  if [[ "$RESULT" == notfound ]]; then
-    echo "Index:   NOT FOUND (run setup to build)"
-    HAS_ERROR=1
-  elif [[ "$RESULT" == error ]]; then
+  if [[ -n "${PREFLIGHT_ERROR:-}" ]]; then
     echo "Index:   ERROR (query failed)"
     HAS_ERROR=1
+  elif [[ "${PREFLIGHT_TABLE_EXISTS:-}" != "true" ]]; then
+    echo "Index:   NOT FOUND (run setup to build)"
+    HAS_ERROR=1
+  else
+    echo "Index:   OK (${PREFLIGHT_CHUNKS:-unknown number of} chunks)"
+  fi
+  if [[ "${PREFLIGHT_LIVE_UPDATER_VIA:-}" == "supervisor" ]]; then
+    echo "Live:    running (supervisor PID: ${PREFLIGHT_LIVE_UPDATER_PID})"
+  elif [[ "${PREFLIGHT_LIVE_UPDATER:-}" == "true" ]]; then
+    echo "Live:    running (PID: ${PREFLIGHT_LIVE_UPDATER_PID})"
   else
-    COUNT="${RESULT#ok:}"
-    echo "Index:   OK ($COUNT chunks)"
+    echo "Live:    not running"
   fi
 fi
 
@@ -0,0 +1,94 @@
+"""言語ごとのチャンク分割プロファイル
+
+DetectProgrammingLanguage の結果（ruby, python 等）ごとに SplitRecursively の
+chunk_size / chunk_overlap / min_chunk_size と構文に沿った分割の有無を切り替える。
+構文に沿った分割（syntax）では SplitRecursively に言語を渡し、tree-sitter で
+クラス・メソッドなどの境界を優先して分割する（未対応の言語はテキストとして分割される）。
+
+設定は DEFAULT_PROFILES に CHUNK_PROFILES 環境変数、main.py の --chunk-profiles の順に上書きする。
+どちらも JSON で、言語名（未定義の言語には "default"）ごとに変更したい項目だけを書く:
+  {"default": {"chunk_overlap": 50}, "ruby": {"chunk_size": 1200}, "markdown": {"syntax": false}}
+"""
+import dataclasses
+import json
+import os
+
+import cocoindex
+
+DEFAULT_PROFILES: dict[str, dict] = {
+    "default": {"chunk_size": 800, "chunk_overlap": 100, "min_chunk_size": 300, "syntax": True},
+    "ruby": {"chunk_size": 1000},
+    "python": {"chunk_size": 1000},
+    "markdown": {"chunk_size": 1200, "min_chunk_size": 400},
+}
+
+PROFILE_KEYS = {"chunk_size", "chunk_overlap", "min_chunk_size", "syntax"}
+
+
+def load_profiles(override: str | None = None) -> dict[str, dict]:
+    """デフォルト・環境変数・CLI の順にマージしたプロファイルを返す（各言語は default で補完済み）"""
+    merged = {lang: dict(profile) for lang, profile in DEFAULT_PROFILES.items()}
+    for source in (os.environ.get("CHUNK_PROFILES"), override):
+        if not source:
+            continue
+        for lang, profile in json.loads(source).items():
+            unknown = set(profile) - PROFILE_KEYS
+            if unknown:
+                raise ValueError(f"unknown chunk profile keys for {lang}: {sorted(unknown)}")
+            merged.setdefault(lang, {}).update(profile)
+
+    default = merged["default"]
+    return {lang: {**default, **profile} for lang, profile in merged.items()}
+
+
+@dataclasses.dataclass
+class ChunkProfile:
+    chunk_size: int
+    chunk_overlap: int
+    min_chunk_size: int
+    language: str | None
+
+
+class SelectChunkProfile(cocoindex.op.FunctionSpec):
+    """言語名から SplitRecursively の引数を選ぶ（profiles は load_profiles() の結果）"""
+
+    profiles: dict[str, dict]
+
+
+@cocoindex.op.executor_class(behavior_version=1)
+class SelectChunkProfileExecutor:
+    spec: SelectChunkProfile
+
+    def __call__(self, language: str | None) -> ChunkProfile:
+        profile = self.spec.profiles.get(language or "", self.spec.profiles["default"])
+        return ChunkProfile(
+            chunk_size=profile["chunk_size"],
+            chunk_overlap=profile["chunk_overlap"],
+            min_chunk_size=min(profile["min_chunk_size"], profile["chunk_size"]),
+            language=language if profile["syntax"] else None,
+        )
+
+
+def print_report(conn, table_name: str) -> None:
+    """言語ごとのファイル数・チャンク数・推定トークン数（4文字≒1トークン）を表示"""
+    from psycopg2 import sql
+
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("""
+            SELECT coalesce(language, '(unknown)'), count(DISTINCT filename), count(*),
+                   sum(length(chunk_text)), avg(length(chunk_text))
+            FROM {} GROUP BY 1 ORDER BY 3 DESC
+        """).format(sql.Identifier(table_name)))
+        rows = cur.fetchall()
+    conn.rollback()
+
+    print(f"{'language':<16}{'files':>8}{'chunks':>9}{'chunks/file':>13}{'avg chars':>11}{'~tokens':>11}")
+    total_files = total_chunks = total_chars = 0
+    for language, files, chunks, chars, avg_chars in rows:
+        print(f"{language:<16}{files:>8}{chunks:>9}{chunks / files:>13.1f}{avg_chars:>11.0f}{chars // 4:>11}")
+        total_files += files
+        total_chunks += chunks
+        total_chars += chars
+    if total_chunks:
+        print(f"{'total':<16}{total_files:>8}{total_chunks:>9}{total_chunks / total_files:>13.1f}"
+              f"{total_chars / total_chunks:>11.0f}{total_chars // 4:>11}")
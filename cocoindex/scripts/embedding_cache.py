@@ -0,0 +1,167 @@
+"""クエリembeddingのディスクキャッシュ
+
+(provider, model, 正規化済みクエリ) をキーに embedding を SQLite に保存し、
+同じ質問の再検索で embedding API 呼び出しを省略する。
+保存先: ~/.config/cocoindex/embedding_cache.sqlite3
+
+設定（~/.config/cocoindex/.env または環境変数）:
+  EMBEDDING_CACHE_MAX_ENTRIES  保持する最大件数（デフォルト: 5000）
+  EMBEDDING_CACHE_TTL_DAYS     最終利用からの有効日数（デフォルト: 30）
+"""
+import array
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+
+CONFIG_DIR = Path.home() / ".config" / "cocoindex"
+CACHE_PATH = CONFIG_DIR / "embedding_cache.sqlite3"
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTL_DAYS = 30
+
+
+def normalize_query(query: str) -> str:
+    """キャッシュキー用にクエリを正規化（NFKC + 空白の畳み込み）"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip()
+
+
+def _cache_key(provider: str, model: str, query: str) -> str:
+    raw = "\0".join([provider, model, normalize_query(query)])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """クエリembeddingのキャッシュ（件数上限・有効期限で削除）
+
+    キャッシュの読み書きに失敗しても検索は止めない（ミス扱いにする）。
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int | None = None, ttl_days: float | None = None):
+        self.path = path
+        self.max_entries = max_entries or int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        ttl = ttl_days if ttl_days is not None else float(os.environ.get("EMBEDDING_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS))
+        self.ttl_seconds = ttl * 86400
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used_at ON embeddings (last_used_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value REAL NOT NULL
+                )
+            """)
+            self._conn = conn
+        return self._conn
+
+    def _bump(self, conn: sqlite3.Connection, name: str, amount: float = 1) -> None:
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def get(self, provider: str, model: str, query: str) -> list[float] | None:
+        """キャッシュ済みembeddingを返す（なければ None）"""
+        try:
+            conn = self._connect()
+            now = time.time()
+            key = _cache_key(provider, model, query)
+            row = conn.execute(
+                "SELECT embedding FROM embeddings WHERE key = ? AND last_used_at >= ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                self._bump(conn, "misses")
+                return None
+            conn.execute("UPDATE embeddings SET last_used_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            self._bump(conn, "hits")
+            return array.array("f", row[0]).tolist()
+        except sqlite3.Error:
+            self.misses += 1
+            return None
+
+    def put(self, provider: str, model: str, query: str, embedding: list[float], elapsed: float = 0.0) -> None:
+        """embeddingを保存し、期限切れ・上限超過分を削除する
+
+        elapsed には embedding API 呼び出しにかかった秒数を渡す（--stats の節約時間推定に使う）。
+        """
+        self.miss_seconds += elapsed
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, provider, model, query, embedding, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _cache_key(provider, model, query), provider, model, normalize_query(query),
+                    array.array("f", embedding).tobytes(), now, now,
+                ),
+            )
+            self._bump(conn, "miss_seconds", elapsed)
+            self.evict(now)
+        except sqlite3.Error:
+            pass
+
+    def evict(self, now: float | None = None) -> None:
+        """有効期限切れと最大件数超過（最終利用が古い順）のエントリを削除"""
+        conn = self._connect()
+        now = now or time.time()
+        conn.execute("DELETE FROM embeddings WHERE last_used_at < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            "  SELECT key FROM embeddings ORDER BY last_used_at DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> dict:
+        """今回のプロセスと累計のヒット/ミス数を返す"""
+        result = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "miss_seconds": self.miss_seconds,
+            "total_hits": 0,
+            "total_misses": 0,
+            "total_miss_seconds": 0.0,
+            "entries": 0,
+        }
+        try:
+            conn = self._connect()
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            result["total_hits"] = int(counters.get("hits", 0))
+            result["total_misses"] = int(counters.get("misses", 0))
+            result["total_miss_seconds"] = counters.get("miss_seconds", 0.0)
+            result["entries"] = conn.execute("SELECT count(*) FROM embeddings").fetchone()[0]
+        except sqlite3.Error:
+            pass
+        return result
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
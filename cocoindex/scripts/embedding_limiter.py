@@ -0,0 +1,165 @@
+"""インデックス構築時の embedding リクエストの分割・並列数・レート制御
+
+cocoindex がまとめて渡すチャンクを EMBEDDING_BATCH_SIZE ごとのリクエストに分け、
+EMBEDDING_CONCURRENCY 本まで並列に送る。EMBEDDING_TPM を指定すると直近1分間の推定トークン数
+（4文字≒1トークン）が上限を超えないように送信を待たせる。
+429（レート制限）を受けたら全リクエストを一時停止し、待ち時間を倍々に延ばして再送する
+（Retry-After ヘッダーがあればそれに従う）。成功が続けば待ち時間は元に戻る。
+
+設定（~/.config/cocoindex/.env または環境変数。main.py の --embed-* で上書き可能）:
+  EMBEDDING_BATCH_SIZE         1リクエストあたりのチャンク数（デフォルト: 128）
+  EMBEDDING_CONCURRENCY        同時に送るリクエスト数の上限（デフォルト: 4）
+  EMBEDDING_TPM                1分あたりの推定トークン数の上限（デフォルト: 0 = 無制限）
+  EMBEDDING_MAX_RETRIES        429 を受けたときの再送回数（デフォルト: 8）
+  EMBEDDING_PROGRESS_INTERVAL  進捗を表示する間隔（秒。0 で表示しない。デフォルト: 30）
+"""
+import collections
+import datetime
+import functools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+DEFAULT_BATCH_SIZE = 128
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TPM = 0
+DEFAULT_MAX_RETRIES = 8
+DEFAULT_PROGRESS_INTERVAL = 30
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+TPM_WINDOW = 60.0
+
+
+def estimate_tokens(texts: list[str]) -> int:
+    return sum(len(t) for t in texts) // 4 + len(texts)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """429 かどうか（openai / voyageai の RateLimitError、requests の HTTPError）"""
+    if type(error).__name__ == "RateLimitError":
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429
+
+
+def retry_after(error: Exception) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class EmbeddingLimiter:
+    """プロセス内で共有するリクエストの並列数・TPM・バックオフの状態"""
+
+    def __init__(self, batch_size: int, concurrency: int, tpm: int, max_retries: int, progress_interval: float):
+        self.batch_size = max(batch_size, 1)
+        self.concurrency = max(concurrency, 1)
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._window: collections.deque[tuple[float, int]] = collections.deque()
+        self._pause_until = 0.0
+        self._backoff = 0.0
+        self._started = time.monotonic()
+        self._last_progress = self._started
+        self.stats = {"requests": 0, "texts": 0, "tokens": 0, "rate_limited": 0, "throttled_seconds": 0.0}
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.stats["throttled_seconds"] += seconds
+        time.sleep(seconds)
+
+    def _reserve_tokens(self, tokens: int) -> None:
+        """直近1分の推定トークン数が EMBEDDING_TPM を超えないよう待つ（1リクエストで上限を超える場合は単独で送る）"""
+        if not self.tpm:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._window and now - self._window[0][0] >= TPM_WINDOW:
+                    self._window.popleft()
+                used = sum(t for _, t in self._window)
+                if not self._window or used + tokens <= self.tpm:
+                    self._window.append((now, tokens))
+                    return
+                wait = TPM_WINDOW - (now - self._window[0][0])
+            self._sleep(wait)
+
+    def _on_rate_limited(self, error: Exception) -> None:
+        with self._lock:
+            self._backoff = min(max(self._backoff * 2, MIN_BACKOFF), MAX_BACKOFF)
+            delay = retry_after(error) or self._backoff * random.uniform(0.5, 1.0)
+            self._pause_until = max(self._pause_until, time.monotonic() + delay)
+            self.stats["rate_limited"] += 1
+
+    def _on_success(self, texts: int, tokens: int) -> None:
+        with self._lock:
+            self._backoff = self._backoff / 2 if self._backoff > MIN_BACKOFF else 0.0
+            self.stats["requests"] += 1
+            self.stats["texts"] += texts
+            self.stats["tokens"] += tokens
+            now = time.monotonic()
+            report = self.progress_interval and now - self._last_progress >= self.progress_interval
+            if report:
+                self._last_progress = now
+        if report:
+            print(f"[{datetime.datetime.now():%H:%M:%S}] Embedding: {self.summary()}", flush=True)
+
+    def _request(self, fn: Callable[[list[str]], list], texts: list[str]) -> list:
+        tokens = estimate_tokens(texts)
+        # 予約は1リクエストにつき1回（429 の再送ごとに同じトークンを窓に積むと EMBEDDING_TPM より強く絞ってしまう）
+        self._reserve_tokens(tokens)
+        attempt = 0
+        while True:
+            with self._lock:
+                pause = self._pause_until - time.monotonic()
+            self._sleep(pause)
+            try:
+                with self._slots:
+                    result = fn(texts)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._on_rate_limited(e)
+                continue
+            self._on_success(len(texts), tokens)
+            return result
+
+    def embed(self, fn: Callable[[list[str]], list], texts: list[str]) -> list:
+        """texts を batch_size ごとに fn へ渡し、結果を元の順序で連結する"""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._request(fn, texts) if texts else []
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+            results = pool.map(lambda batch: self._request(fn, batch), batches)
+            return [e for result in results for e in result]
+
+    def summary(self) -> str:
+        with self._lock:
+            st = dict(self.stats)
+        minutes = max(time.monotonic() - self._started, 1.0) / 60
+        return (f"requests={st['requests']} texts={st['texts']} ~tokens={st['tokens']}"
+                f" ({st['tokens'] / minutes:.0f}/min) 429={st['rate_limited']}"
+                f" throttled={st['throttled_seconds']:.1f}s")
+
+
+@functools.cache
+def get_limiter() -> EmbeddingLimiter:
+    """環境変数の設定でプロセス内の共有インスタンスを作る（最初の呼び出し時に読む）"""
+    return EmbeddingLimiter(
+        batch_size=int(os.environ.get("EMBEDDING_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+        concurrency=int(os.environ.get("EMBEDDING_CONCURRENCY", DEFAULT_CONCURRENCY)),
+        tpm=int(os.environ.get("EMBEDDING_TPM", DEFAULT_TPM)),
+        max_retries=int(os.environ.get("EMBEDDING_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+        progress_interval=float(os.environ.get("EMBEDDING_PROGRESS_INTERVAL", DEFAULT_PROGRESS_INTERVAL)),
+    )
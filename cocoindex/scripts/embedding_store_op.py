@@ -0,0 +1,109 @@
+"""embedding ストアを使う cocoindex の関数（main.py のフロー用）
+
+EmbedText の代わりに EmbedTextWithStore を使い、embedding_store.py のストアに保存済みのチャンクは
+API を呼ばずに再利用する（EMBEDDING_STORE=off でもストアを使わずにこの関数を使い、
+embedding_limiter.py のリクエスト分割・並列数・レート制御を通す）。
+content_hash はチャンク本文の sha256 で、ストアの参照数計算のためにインデックステーブルへ保存する。
+"""
+import threading
+from typing import Literal
+
+import cocoindex
+import numpy as np
+from numpy.typing import NDArray
+
+from embedding_limiter import get_limiter
+from embedding_store import content_hash_of, ensure_table, get_database_url, lookup, store, stored_dimension
+from embeddings import model_key, request_embeddings
+
+# cocoindex は実行中のバッチが終わるまで次の入力を溜めるため、1回の呼び出しで大きめに受け取り
+# embedding_limiter が EMBEDDING_BATCH_SIZE ごとのリクエストに分けて並列に送る
+MAX_CALL_BATCH_SIZE = 1024
+
+# このプロセスでのストアのヒット/ミス数（main.py が更新後に表示する）
+STATS = {"hits": 0, "misses": 0}
+
+
+@cocoindex.op.function(behavior_version=1)
+def content_hash(text: str) -> str:
+    """チャンク本文の sha256（ストアの参照数計算に使う）"""
+    return content_hash_of(text)
+
+
+class EmbedTextWithStore(cocoindex.op.FunctionSpec):
+    """ストアを優先し、未保存のチャンクだけプロバイダーで embedding する（EmbedText の代替）
+
+    use_store=False ではストアを参照・保存せず、全チャンクをプロバイダーで embedding する。
+    """
+
+    provider: str
+    model: str
+    address: str | None = None
+    dimension: int | None = None
+    use_store: bool = True
+
+
+@cocoindex.op.executor_class(cache=True, batching=True, max_batch_size=MAX_CALL_BATCH_SIZE, behavior_version=1)
+class EmbedTextWithStoreExecutor:
+    spec: EmbedTextWithStore
+    _conn = None
+    _lock: threading.Lock
+
+    def _connect(self):
+        import psycopg2
+
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(get_database_url())
+            ensure_table(self._conn)
+        return self._conn
+
+    def _with_conn(self, fn):
+        """fn(conn) を実行する（DB再起動などで切れた接続は作り直して1回だけ再試行）"""
+        import psycopg2
+
+        with self._lock:
+            try:
+                return fn(self._connect())
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = None
+                return fn(self._connect())
+
+    def analyze(self) -> type:
+        self._lock = threading.Lock()
+        key = model_key(self.spec.provider, self.spec.model, self.spec.dimension)
+        dim = self._with_conn(lambda conn: stored_dimension(conn, key)) if self.spec.use_store else None
+        if dim is None:
+            dim = len(request_embeddings(
+                self.spec.provider, self.spec.model, ["dimension probe"],
+                input_type="document", address=self.spec.address, dimension=self.spec.dimension,
+            )[0])
+        return cocoindex.typing.Vector[np.float32, Literal[dim]]  # type: ignore
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        return get_limiter().embed(
+            lambda batch: request_embeddings(
+                self.spec.provider, self.spec.model, batch,
+                input_type="document", address=self.spec.address, dimension=self.spec.dimension,
+            ),
+            texts,
+        )
+
+    def __call__(self, text: list[str]) -> list[NDArray[np.float32]]:
+        if not self.spec.use_store:
+            return [np.asarray(e, dtype=np.float32) for e in self._embed(text)]
+
+        key = model_key(self.spec.provider, self.spec.model, self.spec.dimension)
+        hashes = [content_hash_of(t) for t in text]
+        found = self._with_conn(lambda conn: lookup(conn, key, hashes))
+
+        missing = {h: t for h, t in zip(hashes, text) if h not in found}
+        STATS["hits"] += len(text) - len(missing)
+        STATS["misses"] += len(missing)
+        if missing:
+            new_items = dict(zip(missing.keys(), self._embed(list(missing.values()))))
+            self._with_conn(lambda conn: store(conn, key, new_items))
+            found.update(new_items)
+
+        return [np.asarray(found[h], dtype=np.float32) for h in hashes]
@@ -0,0 +1,123 @@
+"""embedding プロバイダー呼び出しの共通処理
+
+search.py（クエリ）と embedding_store.py（インデックス構築時のチャンク）から使う。
+プロバイダー・モデルは EMBEDDING_PROVIDER / EMBEDDING_MODEL / EMBEDDING_ADDRESS で指定する。
+EMBEDDING_PROVIDER=local ではネットワークを使わず、sentence-transformers のモデルをプロセス内に
+1回だけ読み込んで CPU で embedding する（`uv sync --extra local`、ONNX Runtime は `--extra onnx`）。
+  EMBEDDING_DEVICE         cpu / cuda / mps（デフォルト: cpu）
+  EMBEDDING_LOCAL_BACKEND  torch / onnx / openvino（デフォルト: torch）
+EMBEDDING_DIMENSION を指定すると Matryoshka 表現学習のモデル（voyage-code-3、text-embedding-3-*、
+nomic-embed-text 等）の先頭の次元だけを使い、テーブル・インデックスを小さくする。
+"""
+import functools
+import math
+import os
+import threading
+
+DEFAULT_PROVIDER = "voyage"
+DEFAULT_MODEL = "voyage-code-3"
+DEFAULT_LOCAL_MODEL = "BAAI/bge-small-en-v1.5"
+DEFAULT_OLLAMA_ADDRESS = "http://localhost:11434"
+
+
+def get_provider() -> str:
+    return os.environ.get("EMBEDDING_PROVIDER", DEFAULT_PROVIDER).lower()
+
+
+def get_model() -> str:
+    default = DEFAULT_LOCAL_MODEL if get_provider() == "local" else DEFAULT_MODEL
+    return os.environ.get("EMBEDDING_MODEL", default)
+
+
+def get_dimension() -> int | None:
+    """EMBEDDING_DIMENSION（未指定ならモデルのデフォルト次元）"""
+    value = os.environ.get("EMBEDDING_DIMENSION")
+    return int(value) if value else None
+
+
+def model_key(provider: str, model: str, dimension: int | None = None) -> str:
+    """embedding の互換性を区別するキー（同じキーなら同じベクトル空間）"""
+    key = f"{provider}:{model}"
+    return f"{key}@{dimension}" if dimension else key
+
+
+def truncate_embedding(embedding: list[float], dimension: int) -> list[float]:
+    """先頭 dimension 次元に切り詰めて L2 正規化する（次元指定に対応していない API 用）"""
+    head = embedding[:dimension]
+    norm = math.sqrt(sum(x * x for x in head)) or 1.0
+    return [x / norm for x in head]
+
+
+@functools.cache
+def get_client(provider: str):
+    """プロバイダーのクライアントを生成（常駐プロセスでは使い回される）"""
+    if provider == "openai":
+        import openai
+        return openai.Client()
+    elif provider == "ollama":
+        import requests
+        return requests.Session()
+    else:
+        import voyageai
+        return voyageai.Client()
+
+
+@functools.cache
+def load_local_model(model: str):
+    """sentence-transformers のモデルを読み込む（プロセスごとに1回。常駐プロセスでは使い回される）"""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise ImportError(
+            "EMBEDDING_PROVIDER=local には sentence-transformers が必要です（uv sync --extra local）"
+        ) from e
+    backend = os.environ.get("EMBEDDING_LOCAL_BACKEND", "torch").lower()
+    device = os.environ.get("EMBEDDING_DEVICE", "cpu")
+    return SentenceTransformer(model, device=device, backend=backend), threading.Lock()
+
+
+def encode_local(model: str, texts: list[str], input_type: str) -> list[list[float]]:
+    """正規化済みの embedding を返す（モデルが query / document のプロンプトを定義していれば使う）"""
+    encoder, lock = load_local_model(model)
+    prompt_name = input_type if input_type in (encoder.prompts or {}) else None
+    # 1回の encode が全コアを使うため、並列に呼ばれても順番に処理する
+    with lock:
+        embeddings = encoder.encode(texts, prompt_name=prompt_name, normalize_embeddings=True, convert_to_numpy=True)
+    return embeddings.tolist()
+
+
+def request_embeddings(
+    provider: str,
+    model: str,
+    texts: list[str],
+    input_type: str = "query",
+    address: str | None = None,
+    dimension: int | None = None,
+) -> list[list[float]]:
+    """プロバイダーのAPIを1回呼び出して複数テキストのembeddingをまとめて取得
+
+    input_type は "query"（検索クエリ）または "document"（インデックス対象のチャンク）。
+    区別するのは voyage と、プロンプトを定義している local のモデル（openai / ollama は同じベクトルを返す）。
+    dimension を指定すると voyage / openai は API 側で、ollama / local は取得後に切り詰める。
+    """
+    if provider == "local":
+        embeddings = encode_local(model, texts, input_type)
+        if dimension:
+            embeddings = [truncate_embedding(e, dimension) for e in embeddings]
+        return embeddings
+    client = get_client(provider)
+    if provider == "openai":
+        options = {"dimensions": dimension} if dimension else {}
+        result = client.embeddings.create(input=texts, model=model, **options)
+        return [d.embedding for d in result.data]
+    elif provider == "ollama":
+        address = address or os.environ.get("EMBEDDING_ADDRESS", DEFAULT_OLLAMA_ADDRESS)
+        resp = client.post(f"{address}/api/embed", json={"model": model, "input": texts})
+        resp.raise_for_status()
+        embeddings = resp.json()["embeddings"]
+        if dimension:
+            embeddings = [truncate_embedding(e, dimension) for e in embeddings]
+        return embeddings
+    else:
+        result = client.embed(texts, model=model, input_type=input_type, output_dimension=dimension)
+        return result.embeddings
@@ -0,0 +1,495 @@
+"""インデックス対象ファイルのカスタムソース
+
+LocalFile の代わりに main.py のフローで使うソース。対象ファイルの一覧（相対パス → mtime）を
+FileIndex としてメモリ上に保持する。
+
+- 1回だけの更新・ポーリング常駐（LIVE_UPDATE_MODE=poll）では、list() のたびにツリーを走査する
+- イベント駆動の常駐（LIVE_UPDATE_MODE=watch、デフォルト）では、watch_changes() が
+  ファイルシステムのイベント（Linux は inotify、macOS は FSEvents）で変更されたパスだけを
+  一覧に反映し、list() は走査せずにメモリ上の一覧を返す
+
+cocoindex は mtime（ordinal）が前回と同じファイルを読み込まず、内容の git blob SHA
+（content_version_fp）が前回と同じファイルを再処理しないため、更新1回のコストは
+内容が変わったファイル数に比例する。blob SHA は code_chunks の blob_sha 列にも保存する。
+
+include/exclude パターンは LocalFile と同じ書式（**/*.rb, **/node_modules/** 等）で、
+除外パターンに一致するディレクトリの中には降りない。
+
+ファイルの列挙（FILE_DISCOVERY）:
+  auto  source_path が git の作業ツリーなら git、そうでなければ walk（デフォルト）
+  git   git ls-files（追跡中 + 未追跡で .gitignore されていないファイル）を一覧にする。
+        git の index から読むため巨大な依存ディレクトリを走査せず、.gitignore・.git/info/exclude も反映される。
+        サブモジュールと入れ子のリポジトリは walk で走査する
+  walk  ディレクトリを並列に走査する（FILE_DISCOVERY_WORKERS スレッド、.gitignore は見ない）
+watch モードでイベントから追加するファイルも、git のときは git check-ignore で .gitignore を反映する。
+"""
+import dataclasses
+import hashlib
+import os
+import re
+import stat
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cocoindex
+
+from path_glob import glob_to_regex
+
+DISCOVERY_MODES = ["auto", "git", "walk"]
+DEFAULT_DISCOVERY_WORKERS = 8
+STAT_CHUNK_SIZE = 512
+GIT_TIMEOUT = 120
+
+
+def get_discovery_mode() -> str:
+    mode = os.environ.get("FILE_DISCOVERY", "auto").lower()
+    return mode if mode in DISCOVERY_MODES else "auto"
+
+
+def get_discovery_workers() -> int:
+    default = min(DEFAULT_DISCOVERY_WORKERS, os.cpu_count() or 1)
+    return max(int(os.environ.get("FILE_DISCOVERY_WORKERS", default)), 1)
+
+
+def run_git(root: Path, *args: str, input: bytes | None = None, ok_codes: tuple[int, ...] = (0,)) -> bytes | None:
+    """git を root で実行して標準出力を返す（git がない・失敗した場合は None）"""
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(root), *args], input=input, capture_output=True, timeout=GIT_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode in ok_codes else None
+
+
+class PathMatcher:
+    """include/exclude パターンの判定（パターンは1つの正規表現にまとめて1回で照合する）"""
+
+    def __init__(self, included: list[str], excluded: list[str]):
+        self._included = self._combine(included)
+        self._excluded = self._combine(excluded)
+
+    @staticmethod
+    def _combine(patterns: list[str]) -> re.Pattern | None:
+        if not patterns:
+            return None
+        return re.compile("|".join(rf"(?:{glob_to_regex(p)}\Z)" for p in patterns))
+
+    def is_excluded(self, rel: str) -> bool:
+        return self._excluded is not None and self._excluded.match(rel) is not None
+
+    def is_included(self, rel: str) -> bool:
+        """対象ファイルか（ファイル自身の判定のみ。祖先ディレクトリの除外は走査側で判定する）"""
+        if self._included is not None and self._included.match(rel) is None:
+            return False
+        return not self.is_excluded(rel)
+
+
+class FileIndex:
+    """対象ファイルの一覧（相対パス → mtime マイクロ秒）"""
+
+    def __init__(self, root: str, included: list[str], excluded: list[str]):
+        self.root = Path(root)
+        self.matcher = PathMatcher(included, excluded)
+        self.excluded = excluded
+        self.files: dict[str, int] = {}
+        self.watched = False
+        self.lock = threading.Lock()
+        self.workers = get_discovery_workers()
+        self.git_toplevel: Path | None = None
+        mode = get_discovery_mode()
+        if mode != "walk":
+            toplevel = run_git(self.root, "rev-parse", "--show-toplevel")
+            self.git_toplevel = Path(os.fsdecode(toplevel.strip())) if toplevel else None
+        self.discovery = "git" if self.git_toplevel is not None else "walk"
+
+    def relpath(self, path: str) -> str | None:
+        rel = os.path.relpath(path, self.root)
+        if rel == "." or rel.startswith(".."):
+            return None
+        return Path(rel).as_posix()
+
+    def _scan_dir(self, current: Path) -> tuple[dict[str, int], list[Path]]:
+        """1ディレクトリ分の対象ファイルと、降りるサブディレクトリ（除外ディレクトリは含めない）"""
+        found: dict[str, int] = {}
+        subdirs: list[Path] = []
+        try:
+            entries = os.scandir(current)
+        except OSError:
+            return found, subdirs
+        with entries:
+            for entry in entries:
+                rel = self.relpath(entry.path)
+                if rel is None:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self.matcher.is_excluded(rel):
+                            subdirs.append(Path(entry.path))
+                    elif entry.is_file() and self.matcher.is_included(rel):
+                        found[rel] = entry.stat().st_mtime_ns // 1000
+                except OSError:
+                    continue
+        return found, subdirs
+
+    def _walk(self, start: Path) -> dict[str, int]:
+        """start 以下を走査して対象ファイルを集める（除外ディレクトリには降りない）
+
+        同じ深さのディレクトリを FILE_DISCOVERY_WORKERS スレッドで並列に読む（scandir・stat は GIL を離す）。
+        """
+        found: dict[str, int] = {}
+        level = [start]
+        pool = None
+        try:
+            while level:
+                if len(level) == 1 or self.workers == 1:
+                    results = map(self._scan_dir, level)
+                else:
+                    pool = pool or ThreadPoolExecutor(max_workers=self.workers)
+                    results = pool.map(self._scan_dir, level)
+                next_level = []
+                for files, subdirs in results:
+                    found.update(files)
+                    next_level.extend(subdirs)
+                level = next_level
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return found
+
+    def _stat_files(self, rels: list[str]) -> dict[str, int]:
+        def stat_chunk(chunk: list[str]) -> dict[str, int]:
+            found = {}
+            for rel in chunk:
+                try:
+                    st = os.stat(self.root / rel)
+                except OSError:
+                    # index にあるが作業ツリーで削除されたファイル
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    found[rel] = st.st_mtime_ns // 1000
+            return found
+
+        chunks = [rels[i:i + STAT_CHUNK_SIZE] for i in range(0, len(rels), STAT_CHUNK_SIZE)]
+        found: dict[str, int] = {}
+        if len(chunks) <= 1 or self.workers == 1:
+            results = map(stat_chunk, chunks)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(stat_chunk, chunks))
+        for result in results:
+            found.update(result)
+        return found
+
+    def _git_files(self) -> dict[str, int] | None:
+        """git ls-files で対象ファイルを集める（git が使えなければ None）
+
+        除外パターンは pathspec としても渡し、git 側で未追跡ディレクトリの走査を減らす
+        （判定は PathMatcher でもう一度行う）。
+        """
+        pathspecs = [f":(exclude,glob){p}" for p in self.excluded]
+        out = run_git(self.root, "ls-files", "-z", "--cached", "--others", "--exclude-standard", "--", ".", *pathspecs)
+        if out is None:
+            return None
+
+        excluded_dirs: dict[str, bool] = {"": False}
+
+        def dir_excluded(directory: str) -> bool:
+            if directory not in excluded_dirs:
+                parent = directory.rpartition("/")[0]
+                excluded_dirs[directory] = dir_excluded(parent) or self.matcher.is_excluded(directory)
+            return excluded_dirs[directory]
+
+        files: list[str] = []
+        nested = [rel for rel in self._git_submodules() if not dir_excluded(rel)]
+        for rel in dict.fromkeys(os.fsdecode(p) for p in out.split(b"\0") if p):
+            if rel.endswith("/"):
+                # 未追跡の入れ子のリポジトリ
+                if not dir_excluded(rel.rstrip("/")):
+                    nested.append(rel.rstrip("/"))
+            elif not dir_excluded(rel.rpartition("/")[0]) and self.matcher.is_included(rel):
+                files.append(rel)
+
+        found = self._stat_files(files)
+        for rel in nested:
+            found.update(self._walk(self.root / rel))
+        return found
+
+    def _git_submodules(self) -> list[str]:
+        """source_path 以下のサブモジュール（ls-files には中身が出ないため walk で走査する）"""
+        if self.git_toplevel is None or not (self.git_toplevel / ".gitmodules").exists():
+            return []
+        out = run_git(self.root, "ls-files", "-z", "--stage", "--", ".")
+        if out is None:
+            return []
+        # 各行は "<mode> <object> <stage>\t<path>"、サブモジュールは mode 160000
+        return [os.fsdecode(line.partition(b"\t")[2]) for line in out.split(b"\0") if line.startswith(b"160000 ")]
+
+    def ignored(self, rels: list[str]) -> set[str]:
+        """.gitignore 等で無視されるパス（git を使わない場合は空。追跡中のファイルは無視扱いにならない）"""
+        if self.discovery != "git" or not rels:
+            return set()
+        out = run_git(self.root, "check-ignore", "-z", "--stdin",
+                      input=b"\0".join(os.fsencode(r) for r in rels) + b"\0", ok_codes=(0, 1))
+        if out is None:
+            return set()
+        return {os.fsdecode(p) for p in out.split(b"\0") if p}
+
+    def has_excluded_ancestor(self, rel: str) -> bool:
+        parts = rel.split("/")[:-1]
+        return any(self.matcher.is_excluded("/".join(parts[: i + 1])) for i in range(len(parts)))
+
+    def scan(self) -> None:
+        files = self._git_files() if self.discovery == "git" else None
+        if files is None:
+            files = self._walk(self.root)
+        with self.lock:
+            self.files = files
+
+    def snapshot(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.files)
+
+    def apply_changes(self, paths: set[str]) -> int:
+        """変更されたパス（絶対パス）を一覧に反映し、変化した対象ファイル数を返す
+
+        ディレクトリの作成・移動はその配下を走査し、削除は配下のファイルをまとめて一覧から外す。
+        .gitignore で無視されるファイルは追加しない（一覧にあれば外す）。
+        """
+        updates: dict[str, int] = {}
+        removed: list[str] = []
+        walked: list[str] = []
+        for path in paths:
+            rel = self.relpath(path)
+            if rel is None or self.has_excluded_ancestor(rel) or self.matcher.is_excluded(rel):
+                continue
+            p = Path(path)
+            if p.is_dir():
+                walked.append(rel)
+                updates.update(self._walk(p))
+                continue
+            try:
+                mtime = p.stat().st_mtime_ns // 1000 if p.is_file() and self.matcher.is_included(rel) else None
+            except OSError:
+                mtime = None
+            if mtime is None:
+                removed.append(rel)
+            else:
+                updates[rel] = mtime
+        for rel in self.ignored(list(updates)):
+            del updates[rel]
+            removed.append(rel)
+
+        changed = 0
+        with self.lock:
+            for rel in removed:
+                prefix = rel + "/"
+                stale = [k for k in self.files if k == rel or k.startswith(prefix)]
+                for k in stale:
+                    del self.files[k]
+                changed += len(stale)
+            for rel in walked:
+                prefix = rel + "/"
+                stale = [k for k in self.files if k.startswith(prefix) and k not in updates]
+                for k in stale:
+                    del self.files[k]
+                changed += len(stale)
+            for k, mtime in updates.items():
+                if self.files.get(k) != mtime:
+                    self.files[k] = mtime
+                    changed += 1
+        return changed
+
+
+_INDEXES: dict[tuple, FileIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_file_index(root: str, included: list[str], excluded: list[str]) -> FileIndex:
+    """同じ設定の FileIndex をプロセス内で共有する（ソースと watch_changes が同じ一覧を使う）"""
+    key = (str(Path(root).resolve()), tuple(included), tuple(excluded))
+    with _INDEXES_LOCK:
+        if key not in _INDEXES:
+            _INDEXES[key] = FileIndex(key[0], included, excluded)
+        return _INDEXES[key]
+
+
+def release_file_index(root: str, included: list[str], excluded: list[str]) -> None:
+    """共有している FileIndex を破棄する（supervisor でプロジェクトを切り離したとき）"""
+    key = (str(Path(root).resolve()), tuple(included), tuple(excluded))
+    with _INDEXES_LOCK:
+        _INDEXES.pop(key, None)
+
+
+def git_blob_sha(data: bytes) -> str:
+    """git hash-object と同じ blob SHA（内容が同じなら別ブランチ・別パスでも同じ値）"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class GitCheckout:
+    """source_path を含む git 作業ツリーの HEAD（ブランチ切り替えの検出用）"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        git_dir = self._git("rev-parse", "--absolute-git-dir")
+        self.git_dir = Path(git_dir) if git_dir else None
+        self.head = self.commit()
+
+    def _git(self, *args: str) -> str | None:
+        try:
+            result = subprocess.run(
+                ["git", "-C", str(self.root), *args], capture_output=True, text=True, timeout=30,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    @property
+    def head_path(self) -> str | None:
+        return str(self.git_dir / "HEAD") if self.git_dir else None
+
+    def commit(self) -> str | None:
+        return self._git("rev-parse", "--verify", "-q", "HEAD")
+
+    def wait_unlocked(self, timeout: float = 60.0) -> None:
+        """git checkout 等が index.lock を保持している間（作業ツリーの書き換え中）は待つ"""
+        if self.git_dir is None:
+            return
+        lock = self.git_dir / "index.lock"
+        deadline = time.monotonic() + timeout
+        while lock.exists() and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    def switched_paths(self) -> set[str] | None:
+        """前回から HEAD が変わっていれば、2つのコミット間で変わったファイル（絶対パス）を返す"""
+        new_head = self.commit()
+        if new_head is None or new_head == self.head:
+            return None
+        old_head, self.head = self.head, new_head
+        if old_head is None:
+            return None
+        diff = self._git("diff", "--name-only", "-z", "--relative", "--no-renames", old_head, new_head)
+        if diff is None:
+            return None
+        return {str(self.root / rel) for rel in diff.split("\0") if rel}
+
+
+def watch_changes(index: FileIndex, stop_event: threading.Event, debounce_ms: int, rescan_seconds: float):
+    """ファイルシステムのイベントを待ち、一覧に反映するたびに変化したファイル数を返す（ジェネレーター）
+
+    大量の変更は debounce_ms の間まとめて1回として扱う。ブランチ切り替え（.git/HEAD の変更）は
+    git が index.lock を離すまで待ってから、2つのコミットの差分のファイルをまとめて反映する
+    （後から届く同じファイルのイベントは mtime が変わらないため再更新にならない）。
+    イベントの取りこぼしに備え、rescan_seconds ごとにツリー全体を走査し直す。
+    """
+    import watchfiles
+
+    git = GitCheckout(index.root)
+    head_path = git.head_path
+
+    def watch_filter(change, path: str) -> bool:
+        if path == head_path:
+            return True
+        rel = index.relpath(path)
+        return rel is not None and not index.has_excluded_ancestor(rel) and not index.matcher.is_excluded(rel)
+
+    index.scan()
+    index.watched = True
+    yield len(index.files)
+
+    watch_paths = [index.root]
+    if head_path and index.relpath(head_path) is None:
+        # worktree 等で git ディレクトリが source_path の外にある場合
+        watch_paths.append(Path(head_path))
+
+    next_rescan = time.monotonic() + rescan_seconds
+    try:
+        for changes in watchfiles.watch(
+            *watch_paths,
+            watch_filter=watch_filter,
+            debounce=debounce_ms * 10,
+            step=debounce_ms,
+            stop_event=stop_event,
+            rust_timeout=int(min(rescan_seconds, 60) * 1000),
+            yield_on_timeout=True,
+        ):
+            paths = {path for _, path in changes}
+            if head_path in paths:
+                paths.discard(head_path)
+                git.wait_unlocked()
+                paths |= git.switched_paths() or set()
+            changed = index.apply_changes(paths) if paths else 0
+            if time.monotonic() >= next_rescan:
+                before = index.snapshot()
+                index.scan()
+                changed += len(set(before.items()) ^ set(index.files.items()))
+                next_rescan = time.monotonic() + rescan_seconds
+            if changed:
+                yield changed
+    finally:
+        index.watched = False
+
+
+# --- cocoindex ソース ---
+
+
+class ProjectFiles(cocoindex.op.SourceSpec):
+    """FileIndex の一覧を返すソース（LocalFile の代替）"""
+
+    path: str
+    included_patterns: list[str]
+    excluded_patterns: list[str]
+
+
+@dataclasses.dataclass
+class FileKey:
+    filename: str
+
+
+@dataclasses.dataclass
+class FileContent:
+    content: str
+    blob_sha: str
+
+
+@cocoindex.op.source_connector(spec_cls=ProjectFiles, key_type=FileKey, value_type=FileContent)
+class ProjectFilesConnector:
+    def __init__(self, index: FileIndex):
+        self._index = index
+
+    @staticmethod
+    def create(spec: ProjectFiles) -> "ProjectFilesConnector":
+        return ProjectFilesConnector(get_file_index(spec.path, spec.included_patterns, spec.excluded_patterns))
+
+    def provides_ordinal(self) -> bool:
+        return True
+
+    def list(self, options: cocoindex.op.SourceReadOptions):
+        if not self._index.watched:
+            self._index.scan()
+        for filename, mtime in self._index.snapshot().items():
+            yield cocoindex.op.PartialSourceRow(
+                key=FileKey(filename=filename),
+                data=cocoindex.op.PartialSourceRowData(ordinal=mtime),
+            )
+
+    def get_value(self, key: FileKey, options: cocoindex.op.SourceReadOptions) -> cocoindex.op.PartialSourceRowData:
+        path = self._index.root / key.filename
+        try:
+            if not self._index.matcher.is_included(key.filename) or self._index.has_excluded_ancestor(key.filename):
+                raise FileNotFoundError(key.filename)
+            mtime = path.stat().st_mtime_ns // 1000
+            data = path.read_bytes()
+        except OSError:
+            return cocoindex.op.PartialSourceRowData(value=cocoindex.op.NON_EXISTENCE, ordinal=cocoindex.op.NO_ORDINAL)
+        # blob SHA を内容のフィンガープリントとして渡し、mtime だけが変わったファイル
+        # （ブランチを往復した、touch された等）は cocoindex に再処理させない
+        blob_sha = git_blob_sha(data)
+        return cocoindex.op.PartialSourceRowData(
+            value=FileContent(content=data.decode("utf-8", errors="replace"), blob_sha=blob_sha),
+            ordinal=mtime,
+            content_version_fp=bytes.fromhex(blob_sha),
+        )
@@ -2,7 +2,9 @@
 
 使い方:
   uv run python main.py <source_path> [--patterns "**/*.rb,**/*.py"] [--exclude "**/tmp/**"]
-  uv run python main.py <source_path> --live  # 常駐モード（FlowLiveUpdater）
+  uv run python main.py <source_path> --live  # 常駐モード（変更されたファイルだけをイベント駆動で更新）
+  uv run python main.py <source_path> --report  # 言語ごとのチャンク数・推定トークン数を表示
+  uv run python main.py <source_path> --embed-concurrency 8 --embed-tpm 1000000  # embedding リクエストの並列数・レート上限
 
 プロジェクト名は --name で指定する。
 共通設定は ~/.config/cocoindex/.env で管理:
@@ -13,20 +15,23 @@ import datetime
 import os
 import re
 import signal
+import time
 from pathlib import Path
 
 from dotenv import load_dotenv
 import cocoindex
 
+import chunk_profiles
+import embedding_limiter
+import embedding_store
+import embedding_store_op
+import file_source
+import result_cache
+from embeddings import get_dimension, get_model, get_provider, model_key
+
 CONFIG_DIR = Path.home() / ".config" / "cocoindex"
 load_dotenv(dotenv_path=CONFIG_DIR / ".env")
 
-PROVIDER_MAP = {
-    "voyage": cocoindex.LlmApiType.VOYAGE,
-    "openai": cocoindex.LlmApiType.OPENAI,
-    "ollama": cocoindex.LlmApiType.OLLAMA,
-}
-
 DEFAULT_EXCLUDES = [
     # === 共通 ===
     "**/.*",              # 隠しファイル・ディレクトリ (.git, .idea, .env 等)
@@ -74,28 +79,195 @@ def derive_flow_name(name: str) -> str:
     return f"CodeIndex_{sanitized}"
 
 
-def create_flow(source_path: str, index_name: str, included_patterns: list[str], excluded_patterns: list[str], *, live: bool = False):
-    flow_name = derive_flow_name(index_name)
-
-    provider_name = os.environ.get("EMBEDDING_PROVIDER", "voyage").lower()
-    api_type = PROVIDER_MAP.get(provider_name, cocoindex.LlmApiType.VOYAGE)
-    model = os.environ.get("EMBEDDING_MODEL", "voyage-code-3")
+def derive_table_name(flow_name: str) -> str:
+    """フロー名からエクスポート先テーブル名を生成"""
+    return f"{flow_name}__code_chunks".lower()
+
+
+def derive_index_name(table_name: str, suffix: str) -> str:
+    """テーブル名からインデックス名を生成（PostgreSQL の識別子長63文字に収める）"""
+    max_prefix = 63 - len(suffix) - 1
+    return f"{table_name[:max_prefix]}_{suffix}"
+
+
+def lexical_index_command(table_name: str):
+    """hybrid/lexical 検索用の全文検索・トライグラムインデックスを作成するSQL"""
+    table = f'"{table_name}"'
+    trgm_index = f'"{derive_index_name(table_name, "trgm")}"'
+    fts_index = f'"{derive_index_name(table_name, "fts")}"'
+    return cocoindex.targets.PostgresSqlCommand(
+        name="lexical_indexes",
+        setup_sql=f"""
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS {trgm_index} ON {table} USING gin (chunk_text gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS {fts_index} ON {table} USING gin (to_tsvector('simple', chunk_text));
+        """,
+        teardown_sql=f"""
+            DROP INDEX IF EXISTS {trgm_index};
+            DROP INDEX IF EXISTS {fts_index};
+        """,
+    )
+
+
+def filter_index_command(table_name: str):
+    """search.py の --path-prefix / --glob / --language 用の btree インデックスを作成するSQL
+
+    text_pattern_ops は照合順序によらず前方一致の LIKE（'app/models/%'）にインデックスを使えるようにする。
+    """
+    table = f'"{table_name}"'
+    path_index = f'"{derive_index_name(table_name, "path")}"'
+    language_index = f'"{derive_index_name(table_name, "lang")}"'
+    return cocoindex.targets.PostgresSqlCommand(
+        name="filter_indexes",
+        setup_sql=f"""
+            CREATE INDEX IF NOT EXISTS {path_index} ON {table} (filename text_pattern_ops);
+            CREATE INDEX IF NOT EXISTS {language_index} ON {table} (language);
+        """,
+        teardown_sql=f"""
+            DROP INDEX IF EXISTS {path_index};
+            DROP INDEX IF EXISTS {language_index};
+        """,
+    )
+
+
+def generation_trigger_command(table_name: str):
+    """テーブルの行が変わるたびに世代番号を進めるトリガーを作成するSQL（search_server.py の検索結果キャッシュの無効化用）
+
+    文単位のトリガーなので、cocoindex の1回の書き込みで何行変わっても1回だけ進む。
+    世代番号の更新は書き込みと同じトランザクションでコミットされる。
+    """
+    table = f'"{table_name}"'
+    generations = f'"{result_cache.GENERATION_TABLE}"'
+    trigger = f'"{derive_index_name(table_name, "gen")}"'
+    return cocoindex.targets.PostgresSqlCommand(
+        name="generation_trigger",
+        setup_sql=f"""
+            CREATE TABLE IF NOT EXISTS {generations} (
+                table_name text PRIMARY KEY,
+                generation bigint NOT NULL DEFAULT 0,
+                updated_at timestamptz NOT NULL DEFAULT now()
+            );
+            CREATE OR REPLACE FUNCTION cocoindex_bump_generation() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO {generations} (table_name, generation) VALUES (TG_TABLE_NAME, 1)
+                ON CONFLICT (table_name) DO UPDATE
+                SET generation = {generations}.generation + 1, updated_at = now();
+                RETURN NULL;
+            END $$;
+            INSERT INTO {generations} (table_name) VALUES ('{table_name}') ON CONFLICT DO NOTHING;
+            DROP TRIGGER IF EXISTS {trigger} ON {table};
+            CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION cocoindex_bump_generation();
+        """,
+        teardown_sql=f"""
+            DROP TRIGGER IF EXISTS {trigger} ON {table};
+            DELETE FROM {generations} WHERE table_name = '{table_name}';
+        """,
+    )
+
+
+def embedding_model_command(table_name: str, embedding_key: str):
+    """テーブルの embedding モデル（model_key）を記録するSQL（embedding_store.py gc がモデルごとに参照数を数える）
+
+    モデル・次元を変えると SQL が変わり、cocoindex が記録し直す。
+    """
+    models = f'"{embedding_store.MODEL_TABLE}"'
+    return cocoindex.targets.PostgresSqlCommand(
+        name="embedding_model",
+        setup_sql=f"""
+            CREATE TABLE IF NOT EXISTS {models} (
+                table_name text PRIMARY KEY,
+                model text NOT NULL,
+                updated_at timestamptz NOT NULL DEFAULT now()
+            );
+            INSERT INTO {models} (table_name, model) VALUES ('{table_name}', '{embedding_key}')
+            ON CONFLICT (table_name) DO UPDATE SET model = EXCLUDED.model, updated_at = now();
+        """,
+        teardown_sql=f"DELETE FROM {models} WHERE table_name = '{table_name}';",
+    )
+
+
+def get_vector_quantization() -> str:
+    """ベクトルインデックスの量子化（none: halfvec の HNSW / binary: 二値量子化の HNSW）"""
+    quantization = os.environ.get("VECTOR_QUANTIZATION", "none").lower()
+    return quantization if quantization in ("none", "binary") else "none"
+
+
+def binary_index_command(table_name: str, embedding_key: str):
+    """二値量子化（1次元1ビット）の式インデックスを作成するSQL（pgvector 0.7 以降）
+
+    halfvec の HNSW インデックスの代わりに使い、search.py はハミング距離で粗く取得した候補を
+    halfvec の列で並べ直す。bit の長さは embedding 列の次元（atttypmod）から決める。
+    """
+    index = derive_index_name(table_name, "bq")
+    return cocoindex.targets.PostgresSqlCommand(
+        name="binary_quantized_index",
+        setup_sql=f"""
+            -- embedding: {embedding_key}
+            DO $$
+            DECLARE dim integer;
+            BEGIN
+                SELECT atttypmod INTO dim FROM pg_attribute
+                WHERE attrelid = '"{table_name}"'::regclass AND attname = 'embedding';
+                EXECUTE format(
+                    'CREATE INDEX IF NOT EXISTS %I ON %I USING hnsw ((binary_quantize(embedding)::bit(%s)) bit_hamming_ops)',
+                    '{index}', '{table_name}', dim
+                );
+            END $$;
+        """,
+        teardown_sql=f'DROP INDEX IF EXISTS "{index}";',
+    )
+
+
+def create_flow(
+    source_path: str,
+    index_name: str,
+    included_patterns: list[str],
+    excluded_patterns: list[str],
+    *,
+    live: bool = False,
+    profiles: dict[str, dict] | None = None,
+    flow_name: str | None = None,
+):
+    # flow_name を指定するとテーブル名も変わる（bench.py はインデックス（codeindex_*）と区別するために使う）
+    flow_name = flow_name or derive_flow_name(index_name)
+    profiles = profiles or chunk_profiles.load_profiles()
+
+    provider_name = get_provider()
+    model = get_model()
     address = os.environ.get("EMBEDDING_ADDRESS")
-
-    embed_opts: dict = {"api_type": api_type, "model": model, "task_type": "document"}
-    if address:
-        embed_opts["address"] = address
+    dimension = get_dimension()
+
+    # 他プロジェクトで embedding 済みのチャンクはストアから再利用する。
+    # ストアを使わない場合も同じ関数でリクエストの分割・並列数・レート制御（embedding_limiter）を通す
+    embed_fn = embedding_store_op.EmbedTextWithStore(
+        provider=provider_name, model=model, address=address, dimension=dimension,
+        use_store=embedding_store.is_enabled(),
+    )
+
+    table_name = derive_table_name(flow_name)
+    embedding_key = model_key(provider_name, model, dimension)
+    attachments = [lexical_index_command(table_name), filter_index_command(table_name),
+                   generation_trigger_command(table_name), embedding_model_command(table_name, embedding_key)]
+    vector_indexes = []
+    if get_vector_quantization() == "binary":
+        attachments.append(binary_index_command(table_name, embedding_key))
+    else:
+        vector_indexes.append(cocoindex.VectorIndexDef(
+            field_name="embedding",
+            metric=cocoindex.VectorSimilarityMetric.COSINE_SIMILARITY,
+        ))
 
     interval = int(os.environ.get("LIVE_UPDATE_INTERVAL", "60"))
 
     @cocoindex.flow_def(name=flow_name)
     def code_index_flow(flow_builder: cocoindex.FlowBuilder, data_scope: cocoindex.DataScope):
-        source_opts = {"path": source_path, "included_patterns": included_patterns}
-        if excluded_patterns:
-            source_opts["excluded_patterns"] = excluded_patterns
-
         data_scope["files"] = flow_builder.add_source(
-            cocoindex.sources.LocalFile(**source_opts),
+            file_source.ProjectFiles(
+                path=source_path,
+                included_patterns=included_patterns,
+                excluded_patterns=excluded_patterns,
+            ),
             refresh_interval=datetime.timedelta(seconds=interval) if live else None,
         )
 
@@ -105,19 +277,30 @@ def create_flow(source_path: str, index_name: str, included_patterns: list[str],
             file["language"] = file["filename"].transform(
                 cocoindex.functions.DetectProgrammingLanguage()
             )
+            file["profile"] = file["language"].transform(
+                chunk_profiles.SelectChunkProfile(profiles=profiles)
+            )
             file["chunks"] = file["content"].transform(
                 cocoindex.functions.SplitRecursively(),
-                chunk_size=800,
-                chunk_overlap=200,
+                language=file["profile"]["language"],
+                chunk_size=file["profile"]["chunk_size"],
+                min_chunk_size=file["profile"]["min_chunk_size"],
+                chunk_overlap=file["profile"]["chunk_overlap"],
             )
             with file["chunks"].row() as chunk:
-                chunk["embedding"] = chunk["text"].transform(
-                    cocoindex.functions.EmbedText(**embed_opts)
-                )
+                chunk["content_hash"] = chunk["text"].transform(embedding_store_op.content_hash)
+                chunk["embedding"] = chunk["text"].transform(embed_fn)
+                # 位置は SplitRecursively の start/end（行は1始まり、オフセットは文字単位で end は排他的）
                 code_chunks_collector.collect(
                     filename=file["filename"],
+                    blob_sha=file["blob_sha"],
                     language=file["language"],
                     chunk_text=chunk["text"],
+                    start_line=chunk["start"]["line"],
+                    end_line=chunk["end"]["line"],
+                    start_offset=chunk["start"]["offset"],
+                    end_offset=chunk["end"]["offset"],
+                    content_hash=chunk["content_hash"],
                     embedding=chunk["embedding"],
                     generated_id=cocoindex.GeneratedField.UUID,
                 )
@@ -130,17 +313,57 @@ def create_flow(source_path: str, index_name: str, included_patterns: list[str],
                 },
             ),
             primary_key_fields=["generated_id"],
-            vector_indexes=[
-                cocoindex.VectorIndexDef(
-                    field_name="embedding",
-                    metric=cocoindex.VectorSimilarityMetric.COSINE_SIMILARITY,
-                )
-            ],
+            attachments=attachments,
+            vector_indexes=vector_indexes,
         )
 
     return code_index_flow, flow_name
 
 
+def get_live_update_mode() -> str:
+    """常駐モードの更新方式（watch: ファイルシステムのイベント駆動 / poll: LIVE_UPDATE_INTERVAL ごとに全走査）"""
+    mode = os.environ.get("LIVE_UPDATE_MODE", "watch").lower()
+    return mode if mode in ("watch", "poll") else "watch"
+
+
+def run_watch(flow, flow_name: str, source_path: str, included: list[str], excluded: list[str],
+              stop_event=None) -> None:
+    """変更されたファイルだけを一覧に反映して flow.update() する常駐ループ
+
+    stop_event を渡さない場合は SIGTERM / SIGINT で停止する（メインスレッドからのみ）。
+    """
+    import threading
+
+    if stop_event is None:
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda s, f: stop_event.set())
+        signal.signal(signal.SIGINT, lambda s, f: stop_event.set())
+
+    index = file_source.get_file_index(source_path, included, excluded)
+    changes = file_source.watch_changes(
+        index,
+        stop_event,
+        debounce_ms=int(os.environ.get("LIVE_DEBOUNCE_MS", "500")),
+        rescan_seconds=float(os.environ.get("LIVE_RESCAN_INTERVAL", "3600")),
+    )
+    print(f"Live updater started: {flow_name} (PID: {os.getpid()}, mode: watch)", flush=True)
+    for changed in changes:
+        started = time.perf_counter()
+        stats = flow.update()
+        print(f"[{datetime.datetime.now():%H:%M:%S}] {changed} file(s) changed, "
+              f"updated in {time.perf_counter() - started:.1f}s: {stats}", flush=True)
+    print(f"Live updater stopped: {flow_name}")
+
+
+def build_patterns(patterns: str, exclude: str, no_default_excludes: bool) -> tuple[list[str], list[str]]:
+    """--patterns / --exclude / --no-default-excludes から対象・除外パターンを作る"""
+    included = [p.strip() for p in patterns.split(",")]
+    excluded = list(DEFAULT_EXCLUDES) if not no_default_excludes else []
+    if exclude:
+        excluded.extend(p.strip() for p in exclude.split(",") if p.strip())
+    return included, excluded
+
+
 def main():
     parser = argparse.ArgumentParser(description="コードベースのベクトルインデックスを構築")
     parser.add_argument("source_path", help="インデックス対象ディレクトリ（絶対パス）")
@@ -148,21 +371,35 @@ def main():
     parser.add_argument("--exclude", default="", help="追加除外パターン（カンマ区切り）")
     parser.add_argument("--no-default-excludes", action="store_true", help="デフォルト除外パターンを無効化")
     parser.add_argument("--name", default=None, help="プロジェクト名（未指定時は source_path の親ディレクトリ名）")
-    parser.add_argument("--live", action="store_true", help="FlowLiveUpdater で常駐モード起動")
+    parser.add_argument("--live", action="store_true", help="常駐モード起動（LIVE_UPDATE_MODE=poll で FlowLiveUpdater の定期走査）")
+    parser.add_argument("--chunk-profiles", default=None,
+                        help='言語ごとのチャンク設定（JSON、例: \'{"ruby": {"chunk_size": 1200, "chunk_overlap": 100}}\'）')
+    parser.add_argument("--report", action="store_true", help="構築後に言語ごとのチャンク数・推定トークン数を表示")
+    parser.add_argument("--embed-batch-size", type=int, default=None,
+                        help=f"1リクエストあたりのチャンク数（EMBEDDING_BATCH_SIZE、デフォルト: {embedding_limiter.DEFAULT_BATCH_SIZE}）")
+    parser.add_argument("--embed-concurrency", type=int, default=None,
+                        help=f"同時に送る embedding リクエスト数（EMBEDDING_CONCURRENCY、デフォルト: {embedding_limiter.DEFAULT_CONCURRENCY}）")
+    parser.add_argument("--embed-tpm", type=int, default=None,
+                        help="1分あたりの推定トークン数の上限（EMBEDDING_TPM、デフォルト: 無制限）")
     args = parser.parse_args()
+    for value, name in [(args.embed_batch_size, "EMBEDDING_BATCH_SIZE"), (args.embed_concurrency, "EMBEDDING_CONCURRENCY"),
+                        (args.embed_tpm, "EMBEDDING_TPM")]:
+        if value is not None:
+            os.environ[name] = str(value)
 
     name = get_project_name(args.name, args.source_path)
     source_path = str(Path(args.source_path).resolve())
-    included = [p.strip() for p in args.patterns.split(",")]
-    excluded = list(DEFAULT_EXCLUDES) if not args.no_default_excludes else []
-    if args.exclude:
-        excluded.extend(p.strip() for p in args.exclude.split(",") if p.strip())
+    included, excluded = build_patterns(args.patterns, args.exclude, args.no_default_excludes)
 
     cocoindex.init()
-    flow, flow_name = create_flow(source_path, name, included, excluded, live=args.live)
+    profiles = chunk_profiles.load_profiles(args.chunk_profiles)
+    poll = args.live and get_live_update_mode() == "poll"
+    flow, flow_name = create_flow(source_path, name, included, excluded, live=poll, profiles=profiles)
     flow.setup()
 
-    if args.live:
+    if args.live and get_live_update_mode() == "watch":
+        run_watch(flow, flow_name, source_path, included, excluded)
+    elif args.live:
         print(f"Live updater started: {flow_name} (PID: {os.getpid()})")
         with cocoindex.FlowLiveUpdater(
             flow,
@@ -174,9 +411,21 @@ def main():
         print(f"Live updater stopped: {flow_name}")
     else:
         flow.update()
-        table_name = f"{flow_name}__code_chunks".lower()
+        table_name = derive_table_name(flow_name)
         print(f"Done: {flow_name}")
+        if embedding_store.is_enabled():
+            st = embedding_store_op.STATS
+            print(f"Embedding store: reused={st['hits']} embedded={st['misses']}")
+        print(f"Embedding API: {embedding_limiter.get_limiter().summary()}")
         print(f"Table: {table_name}")
+        if args.report:
+            import psycopg2
+
+            conn = psycopg2.connect(embedding_store.get_database_url())
+            try:
+                chunk_profiles.print_report(conn, table_name)
+            finally:
+                conn.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+"""インデックステーブルの VACUUM / ANALYZE / REINDEX
+
+データベース全体を VACUUM する代わりに、現プロジェクトのテーブル（code_chunks と
+cocoindex の tracking テーブル）だけを pg_stat_user_tables の不要タプル率・変更行数で判定し、
+しきい値を超えたものだけを処理する。処理内容と所要時間を表示する。
+
+使い方:
+  uv run python maintenance.py --project-dir "$PWD"            # 現プロジェクトのテーブル
+  uv run python maintenance.py --project-dir "$PWD" --dry-run  # 判定だけ表示
+  uv run python maintenance.py --all --include-store           # 全インデックス + embeddingストア
+
+判定（~/.config/cocoindex/.env または環境変数で変更可能）:
+  MAINTENANCE_VACUUM_DEAD_RATIO   不要タプル率がこれ以上なら VACUUM (ANALYZE)（デフォルト: 0.1）
+  MAINTENANCE_MIN_DEAD_TUPLES     不要タプルがこれ未満なら VACUUM しない（デフォルト: 500）
+  MAINTENANCE_ANALYZE_RATIO       最後の ANALYZE 以降の変更行の割合がこれ以上なら ANALYZE（デフォルト: 0.1）
+  MAINTENANCE_REINDEX_DEAD_RATIO  不要タプル率がこれ以上なら VACUUM の前に REINDEX CONCURRENTLY（デフォルト: 0.3）
+HNSW インデックスは削除された行の掃除が遅いため、大量の更新後は作り直してから VACUUM する方が速い。
+中断された REINDEX CONCURRENTLY が残した無効なインデックス（*_ccnew 等）は、処理の前に削除する。
+"""
+import argparse
+import os
+import sys
+import time
+
+from embedding_store import STORE_TABLE
+from search import TABLE_SUFFIX, get_database_url, get_table_name
+
+TRACKING_SUFFIX = "__cocoindex_tracking"
+
+DEFAULT_VACUUM_DEAD_RATIO = 0.1
+DEFAULT_MIN_DEAD_TUPLES = 500
+DEFAULT_ANALYZE_RATIO = 0.1
+DEFAULT_REINDEX_DEAD_RATIO = 0.3
+
+
+def project_tables(project_dir: str) -> list[str]:
+    """プロジェクトの code_chunks と tracking テーブル"""
+    chunks = get_table_name(project_dir)
+    return [chunks, chunks.removesuffix(TABLE_SUFFIX) + TRACKING_SUFFIX]
+
+
+def all_index_tables(conn) -> list[str]:
+    with conn.cursor() as cur:
+        cur.execute(r"""
+            SELECT relname FROM pg_stat_user_tables
+            WHERE schemaname = current_schema() AND relname LIKE 'codeindex\_%'
+            ORDER BY relname
+        """)
+        return [r[0] for r in cur.fetchall()]
+
+
+def table_stats(conn, tables: list[str]) -> list[dict]:
+    """pg_stat_user_tables の行数・不要タプル数（存在しないテーブルは含まない）"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT relname, n_live_tup, n_dead_tup, n_mod_since_analyze,
+                   pg_total_relation_size(relid),
+                   (SELECT count(*) FROM pg_index i WHERE i.indrelid = s.relid)
+            FROM pg_stat_user_tables s
+            WHERE schemaname = current_schema() AND relname = ANY(%s)
+            ORDER BY relname
+        """, (tables,))
+        keys = ["table", "live", "dead", "modified", "bytes", "indexes"]
+        return [dict(zip(keys, row)) for row in cur.fetchall()]
+
+
+def get_thresholds() -> dict:
+    return {
+        "vacuum_dead_ratio": float(os.environ.get("MAINTENANCE_VACUUM_DEAD_RATIO", DEFAULT_VACUUM_DEAD_RATIO)),
+        "min_dead_tuples": int(os.environ.get("MAINTENANCE_MIN_DEAD_TUPLES", DEFAULT_MIN_DEAD_TUPLES)),
+        "analyze_ratio": float(os.environ.get("MAINTENANCE_ANALYZE_RATIO", DEFAULT_ANALYZE_RATIO)),
+        "reindex_dead_ratio": float(os.environ.get("MAINTENANCE_REINDEX_DEAD_RATIO", DEFAULT_REINDEX_DEAD_RATIO)),
+    }
+
+
+def plan_actions(stat: dict, thresholds: dict) -> list[str]:
+    """テーブルの統計から実行する処理を決める（reindex → vacuum の順。vacuum は analyze を兼ねる）"""
+    total = stat["live"] + stat["dead"]
+    dead_ratio = stat["dead"] / total if total else 0.0
+    actions = []
+    if stat["dead"] >= thresholds["min_dead_tuples"] and dead_ratio >= thresholds["vacuum_dead_ratio"]:
+        if stat["indexes"] and dead_ratio >= thresholds["reindex_dead_ratio"]:
+            actions.append("reindex")
+        actions.append("vacuum")
+    elif stat["modified"] and stat["modified"] >= max(stat["live"], 1) * thresholds["analyze_ratio"]:
+        actions.append("analyze")
+    return actions
+
+
+def drop_invalid_indexes(conn, tables: list[str]) -> list[str]:
+    """中断された REINDEX CONCURRENTLY が残した無効なインデックスを削除し、その名前を返す
+
+    無効なインデックスも書き込みのたびに更新されるため、残しておくと肥大化が進む。
+    別のセッションが REINDEX 実行中のテーブル（pg_stat_progress_create_index にある）は対象にしない。
+    """
+    from psycopg2 import sql
+
+    with conn.cursor() as cur:
+        cur.execute(r"""
+            SELECT c.relname FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_class t ON t.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace
+            WHERE n.nspname = current_schema() AND t.relname = ANY(%s)
+              AND NOT i.indisvalid AND c.relname ~ '_cc(new|old)[0-9]*$'
+              AND NOT EXISTS (SELECT 1 FROM pg_stat_progress_create_index p WHERE p.relid = t.oid)
+        """, (tables,))
+        names = [r[0] for r in cur.fetchall()]
+        for name in names:
+            cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(name)))
+    return names
+
+
+def run_actions(conn, table_name: str, actions: list[str]) -> float:
+    """処理を実行して秒数を返す（conn は autocommit。REINDEX CONCURRENTLY はトランザクション外でのみ実行可能）"""
+    from psycopg2 import sql
+
+    table = sql.Identifier(table_name)
+    statements = {
+        "reindex": sql.SQL("REINDEX TABLE CONCURRENTLY {}"),
+        "vacuum": sql.SQL("VACUUM (ANALYZE) {}"),
+        "analyze": sql.SQL("ANALYZE {}"),
+    }
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        for action in actions:
+            cur.execute(statements[action].format(table))
+    return time.perf_counter() - started
+
+
+def format_stat(stat: dict) -> str:
+    total = stat["live"] + stat["dead"]
+    dead_ratio = stat["dead"] / total if total else 0.0
+    return (f"live={stat['live']} dead={stat['dead']} ({dead_ratio:.1%}) modified={stat['modified']}"
+            f" size={stat['bytes'] / 1024 / 1024:.1f}MB")
+
+
+def main():
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description="インデックステーブルの VACUUM / ANALYZE / REINDEX を必要なものだけ実行")
+    parser.add_argument("--project-dir", action="append", default=[], help="対象プロジェクトのディレクトリ（複数指定可）")
+    parser.add_argument("--all", action="store_true", help="全インデックス（codeindex_*）のテーブルを対象にする")
+    parser.add_argument("--include-store", action="store_true", help=f"embeddingストア（{STORE_TABLE}）も対象にする")
+    parser.add_argument("--dry-run", action="store_true", help="判定結果だけを表示して実行しない")
+    args = parser.parse_args()
+    if not args.project_dir and not args.all and not args.include_store:
+        parser.error("--project-dir、--all、--include-store のいずれかを指定してください")
+
+    conn = psycopg2.connect(get_database_url(), connect_timeout=3)
+    conn.autocommit = True
+    try:
+        tables = all_index_tables(conn) if args.all else [t for d in args.project_dir for t in project_tables(d)]
+        if args.include_store:
+            tables.append(STORE_TABLE)
+
+        started = time.perf_counter()
+        if not args.dry_run:
+            for name in drop_invalid_indexes(conn, tables):
+                print(f"{name}: dropped invalid index left by an interrupted REINDEX")
+
+        thresholds = get_thresholds()
+        processed = 0
+        for stat in table_stats(conn, tables):
+            actions = plan_actions(stat, thresholds)
+            if not actions:
+                print(f"{stat['table']}: ok  {format_stat(stat)}")
+                continue
+            if args.dry_run:
+                print(f"{stat['table']}: would {' + '.join(actions)}  {format_stat(stat)}")
+                continue
+            try:
+                seconds = run_actions(conn, stat["table"], actions)
+            except psycopg2.Error as e:
+                print(f"{stat['table']}: {' + '.join(actions)} failed: {e.pgerror or e}".rstrip(), file=sys.stderr)
+                continue
+            processed += 1
+            print(f"{stat['table']}: {' + '.join(actions)} in {seconds:.2f}s  {format_stat(stat)}")
+        print(f"Maintenance: {processed} table(s) processed in {time.perf_counter() - started:.2f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
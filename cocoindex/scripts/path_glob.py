@@ -0,0 +1,37 @@
+"""ファイルパターン（main.py --patterns / --exclude と同じ書式）の正規表現への変換
+
+file_source.py（対象ファイルの判定、Python の re）と search.py --glob（PostgreSQL の ~ 演算子）で
+同じパターンが同じファイルに一致するよう、変換はここにまとめる。
+cocoindex を import しないため、search.py の起動を重くしない。
+"""
+import re
+
+
+def glob_to_regex(pattern: str) -> str:
+    """glob（**, *, ?）を相対パスに一致する正規表現（アンカーなし）に変換
+
+    **/ は0個以上のディレクトリ、末尾の /** はディレクトリ自身とその中身、* と ? は / 以外に一致する。
+    生成する構文は Python の re と PostgreSQL の正規表現（ARE）の共通部分だけを使う。
+    """
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("(?:/.*)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
@@ -0,0 +1,164 @@
+"""セッション開始時・ヘルスチェック用の事前確認
+
+PostgreSQL 接続・インデックステーブルの有無・LiveUpdater と検索サーバーの起動状態を
+1プロセス・1接続で確認し、結果を JSON（または hooks から eval できるシェル変数）で出力する。
+cocoindex を import しないため、起動コストは psycopg2 の import 程度。
+
+使い方:
+  uv run python preflight.py --project-dir "$PWD"                  # JSON
+  uv run python preflight.py --project-dir "$PWD" --format shell   # PREFLIGHT_*=... （hooks 用）
+  uv run python preflight.py --project-dir "$PWD" --count          # チャンク数を正確に数える（遅い）
+
+出力項目:
+  database      ok / unreachable
+  table_exists  現プロジェクトのインデックステーブルの有無
+  chunks        チャンク数（--count なしでは pg_class の推定値。一度も ANALYZE されていないテーブルは不明として空）
+  live_updater  現プロジェクトの LiveUpdater が起動中か（live_updater_pid はその PID）
+  live_updater_via  supervisor（supervisor.py に attach 済み）/ process（プロジェクト単位の main.py --live）
+  search_server 常駐検索サーバーがソケットで待ち受けているか
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+from pathlib import Path
+
+from search import SERVER_SOCKET_PATH, get_database_url, get_index_name, get_table_name
+
+PID_DIR = Path.home() / ".claude" / "tmp"
+CONNECT_TIMEOUT = 3
+
+
+def find_supervised(index_name: str) -> int | None:
+    """supervisor に現プロジェクトが attach されて動いていれば supervisor の PID を返す
+
+    supervisor.py は dotenv を読むだけなので import しても軽い（ソケットのパスを共有する）。
+    """
+    import socket
+
+    from supervisor import SOCKET_PATH
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(SOCKET_PATH))
+            sock.sendall(json.dumps({"command": "status"}).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                response = json.loads(f.readline() or b"{}")
+    except (OSError, ValueError):
+        return None
+    for project in response.get("projects", []):
+        if project.get("name") == index_name and project.get("state") in ("starting", "running"):
+            return response.get("pid")
+    return None
+
+
+def find_live_updater(index_name: str) -> int | None:
+    """PID ファイル（session-start.sh が作成）か pgrep でプロジェクト単位の LiveUpdater（main.py --live）を探す"""
+    pid_file = PID_DIR / f".pid_cocoindex_{index_name}"
+    try:
+        pid = int(pid_file.read_text().strip())
+        os.kill(pid, 0)
+        return pid
+    except (OSError, ValueError):
+        pass
+    try:
+        result = subprocess.run(
+            ["pgrep", "-f", f"main.py.*--name {index_name} --live"],
+            capture_output=True, text=True, timeout=CONNECT_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    pids = [int(p) for p in result.stdout.split() if p.isdigit() and int(p) != os.getpid()]
+    return pids[0] if pids else None
+
+
+def is_search_server_alive() -> bool:
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(str(SERVER_SOCKET_PATH))
+        return True
+    except OSError:
+        return False
+
+
+def check(project_dir: str, count: bool = False) -> dict:
+    import psycopg2
+
+    table_name = get_table_name(project_dir)
+    index_name = get_index_name(project_dir)
+    live_pid = find_supervised(index_name)
+    via = "supervisor" if live_pid is not None else None
+    if live_pid is None:
+        live_pid = find_live_updater(index_name)
+        via = "process" if live_pid is not None else None
+    status = {
+        "project": Path(project_dir).name,
+        "index_name": index_name,
+        "table": table_name,
+        "database": "unreachable",
+        "table_exists": False,
+        "chunks": None,
+        "live_updater": live_pid is not None,
+        "live_updater_pid": live_pid,
+        "live_updater_via": via,
+        "search_server": is_search_server_alive(),
+    }
+
+    try:
+        conn = psycopg2.connect(get_database_url(), connect_timeout=CONNECT_TIMEOUT)
+    except psycopg2.Error as e:
+        status["error"] = str(e).strip()
+        return status
+    status["database"] = "ok"
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", (f'"{table_name}"',))
+            row = cur.fetchone()
+            if row is not None:
+                status["table_exists"] = True
+                # reltuples = -1 は未 ANALYZE（空とは限らない）なので 0 と報告しない
+                status["chunks"] = row[0] if row[0] >= 0 else None
+                if count:
+                    cur.execute(f'SELECT count(*) FROM "{table_name}"')
+                    status["chunks"] = cur.fetchone()[0]
+    except psycopg2.Error as e:
+        status["error"] = str(e).strip()
+    finally:
+        conn.close()
+    return status
+
+
+def format_shell(status: dict) -> str:
+    """PREFLIGHT_<KEY>=value 形式（bool は true/false、None は空文字）"""
+    lines = []
+    for key, value in status.items():
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        elif value is None:
+            value = ""
+        lines.append(f"PREFLIGHT_{key.upper()}={shlex.quote(str(value))}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PostgreSQL・インデックス・常駐プロセスの状態を1回で確認")
+    parser.add_argument("--project-dir", default=os.environ.get("CLAUDE_PROJECT_DIR") or os.getcwd(),
+                        help="プロジェクトディレクトリ（デフォルト: $CLAUDE_PROJECT_DIR または カレントディレクトリ）")
+    parser.add_argument("--format", choices=["json", "shell"], default="json", help="出力形式")
+    parser.add_argument("--count", action="store_true", help="チャンク数を count(*) で正確に数える")
+    args = parser.parse_args()
+
+    status = check(args.project_dir, count=args.count)
+    if args.format == "shell":
+        print(format_shell(status))
+    else:
+        print(json.dumps(status, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""検索結果の再ランキング（2段階目）
+
+search.py --rerank で、ベクトル/全文検索で多めに取得した候補（ファイル単位、RERANK_CANDIDATES 件）を
+クエリとチャンク本文の関連度で並べ直し、上位 --top 件だけを返す。コサイン類似度では 6〜15 位に
+埋もれがちな正解ファイルを上位に上げ、読むファイル数を減らすためのもの。
+再ランキングに送るテキストは RERANK_TOKEN_BUDGET（推定トークン数、4文字≒1トークン）に収まるよう
+候補ごとに均等に切り詰める。候補1件あたり MIN_DOCUMENT_CHARS 文字を確保できない場合は、
+取得する候補数を減らす（--top 件は下回らない）。
+
+プロバイダー（--rerank-provider、省略時は RERANK_PROVIDER）:
+  voyage  Voyage AI の rerank API（VOYAGE_API_KEY を使う）
+  local   sentence-transformers の CrossEncoder をプロセス内で実行（uv sync --extra local）
+  stub    クエリの単語がファイル名・本文に含まれる割合で並べる（外部サービス・モデル不要。動作確認用）
+
+設定（~/.config/cocoindex/.env または環境変数）:
+  RERANK_PROVIDER      デフォルトのプロバイダー（デフォルト: voyage）
+  RERANK_MODEL         RERANK_PROVIDER のプロバイダーで使うモデル名（--rerank-provider で別のプロバイダーを
+                       指定した場合は使わない。デフォルト: voyage は rerank-2.5-lite、local は cross-encoder/ms-marco-MiniLM-L-6-v2）
+  RERANK_CANDIDATES    再ランキングする候補数（デフォルト: 20。--top より小さければ --top）
+  RERANK_TOKEN_BUDGET  1クエリで再ランキングに送る推定トークン数の上限（デフォルト: 16000）
+"""
+import functools
+import os
+import re
+import threading
+
+PROVIDERS = ["voyage", "local", "stub"]
+DEFAULT_PROVIDER = "voyage"
+DEFAULT_MODELS = {
+    "voyage": "rerank-2.5-lite",
+    "local": "cross-encoder/ms-marco-MiniLM-L-6-v2",
+    "stub": "stub",
+}
+DEFAULT_CANDIDATES = 20
+DEFAULT_TOKEN_BUDGET = 16000
+MIN_DOCUMENT_CHARS = 200
+WORD_RE = re.compile(r"[A-Za-z0-9]{2,}|[^\sA-Za-z0-9]{2,}")
+
+
+def get_provider() -> str:
+    provider = os.environ.get("RERANK_PROVIDER", DEFAULT_PROVIDER).lower()
+    return provider if provider in PROVIDERS else DEFAULT_PROVIDER
+
+
+def get_model(provider: str) -> str:
+    # RERANK_MODEL は RERANK_PROVIDER のモデル名なので、他のプロバイダーにはデフォルトのモデルを使う
+    if provider == get_provider():
+        return os.environ.get("RERANK_MODEL") or DEFAULT_MODELS[provider]
+    return DEFAULT_MODELS[provider]
+
+
+def get_candidates(top: int) -> int:
+    return max(int(os.environ.get("RERANK_CANDIDATES", DEFAULT_CANDIDATES)), top)
+
+
+def get_token_budget() -> int:
+    return int(os.environ.get("RERANK_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+
+
+def fit_candidates(query: str, candidates: int, top: int, token_budget: int | None = None) -> int:
+    """各候補に MIN_DOCUMENT_CHARS 文字以上を割り当てられるよう候補数を減らす（top 件は下回らない）"""
+    per_document = len(query) // 4 + MIN_DOCUMENT_CHARS // 4
+    return max(min(candidates, (token_budget or get_token_budget()) // per_document), top)
+
+
+def fit_budget(query: str, documents: list[str], token_budget: int) -> list[str]:
+    """クエリと候補の合計が token_budget に収まるよう、各候補を同じ文字数に切り詰める"""
+    if not documents:
+        return []
+    # プロバイダーは候補ごとにクエリを連結して数えるため、クエリ分も候補数だけ差し引く
+    available = max(token_budget - len(query) // 4 * len(documents), 0) * 4
+    return [d[:available // len(documents)] for d in documents]
+
+
+@functools.cache
+def load_cross_encoder(model: str):
+    """CrossEncoder を読み込む（プロセスごとに1回。常駐検索サーバーでは使い回される）"""
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError as e:
+        raise ImportError("--rerank-provider local には sentence-transformers が必要です（uv sync --extra local）") from e
+    return CrossEncoder(model, device=os.environ.get("EMBEDDING_DEVICE", "cpu")), threading.Lock()
+
+
+def _stub_scores(query: str, documents: list[str]) -> list[float]:
+    words = {w.lower() for w in WORD_RE.findall(query)}
+    if not words:
+        return [0.0] * len(documents)
+    scores = []
+    for document in documents:
+        found = {w.lower() for w in WORD_RE.findall(document)}
+        scores.append(len(words & found) / len(words))
+    return scores
+
+
+def score_documents(provider: str, model: str, query: str, documents: list[str]) -> list[float]:
+    """候補ごとの関連度（大きいほど関連が高い。値の範囲はプロバイダーによって異なる）"""
+    if provider == "stub":
+        return _stub_scores(query, documents)
+    if provider == "local":
+        encoder, lock = load_cross_encoder(model)
+        with lock:
+            return [float(s) for s in encoder.predict([(query, d) for d in documents])]
+
+    from embeddings import get_client
+
+    result = get_client("voyage").rerank(query, documents, model=model, truncation=True)
+    scores = [0.0] * len(documents)
+    for r in result.results:
+        scores[r.index] = r.relevance_score
+    return scores
+
+
+def document_text(result: dict) -> str:
+    """再ランキングに渡すテキスト（ファイル名もクエリとの関連の手がかりになるため先頭に付ける）"""
+    return f"{result['filename']}\n{result['chunk_text']}"
+
+
+def rerank(query: str, results: list[dict], top: int, provider: str | None = None,
+           token_budget: int | None = None) -> list[dict]:
+    """検索結果を並べ直して上位 top 件を返す
+
+    score は再ランキングの関連度に置き換え、元の score と順位は retrieval_score / retrieval_rank に残す。
+    同じ関連度なら元の順位を優先する。
+    """
+    if not results:
+        return []
+    provider = provider or get_provider()
+    documents = fit_budget(query, [document_text(r) for r in results], token_budget or get_token_budget())
+    scores = score_documents(provider, get_model(provider), query, documents)
+    order = sorted(range(len(results)), key=lambda i: (-scores[i], i))
+
+    reranked = []
+    for i in order[:top]:
+        result = dict(results[i])
+        result["retrieval_score"] = result["score"]
+        result["retrieval_rank"] = i + 1
+        result["score"] = scores[i]
+        reranked.append(result)
+    return reranked
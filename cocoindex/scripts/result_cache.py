@@ -0,0 +1,100 @@
+"""検索結果のメモリキャッシュ（常駐検索サーバー内）
+
+同じセッションで同じ質問を繰り返したときに、近傍探索・全文検索をやり直さずに前回の結果を返す。
+キーは (テーブル, クエリ embedding のハッシュ, top, mode, 絞り込み条件などの検索オプション)。
+lexical / hybrid では embedding の代わりに（または加えて）正規化したクエリ文字列をキーに含める。
+
+各チャンクテーブルには main.py が文単位のトリガーを付け、行が追加・更新・削除されるたびに
+cocoindex_index_generation のテーブルごとの世代番号を同じトランザクション内で1つ進める。
+キャッシュした結果には検索前に読んだ世代番号を記録し、読み出し時に現在の世代番号と一致するものだけを返す。
+世代番号は検索より前に読むため、検索中に更新がコミットされても古い世代として記録され、
+次の問い合わせで必ず検索し直す（インデックスより古い結果は返さない）。
+世代番号の行がないテーブル（トリガー導入前に構築したインデックス）はキャッシュしない。
+
+設定（~/.config/cocoindex/.env または環境変数）:
+  SEARCH_RESULT_CACHE_MAX_ENTRIES  保持する最大件数（デフォルト: 1000。0 で無効）
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+
+from embedding_cache import normalize_query
+
+GENERATION_TABLE = "cocoindex_index_generation"
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def get_generations(conn, tables: list[str]) -> dict[str, int]:
+    """テーブルごとの現在の世代番号（行がない・世代テーブル自体がないテーブルは含まない）"""
+    from psycopg2 import sql
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (GENERATION_TABLE,))
+        if not cur.fetchone()[0]:
+            return {}
+        cur.execute(
+            sql.SQL("SELECT table_name, generation FROM {} WHERE table_name = ANY(%s)").format(
+                sql.Identifier(GENERATION_TABLE),
+            ),
+            (tables,),
+        )
+        return dict(cur.fetchall())
+
+
+def make_key(tables: list[str], query: str, embedding: list[float] | None, top: int, mode: str,
+             options: dict) -> str:
+    """キャッシュキー（embedding は値のハッシュ、lexical / hybrid ではクエリ文字列も含める）"""
+    embedding_hash = hashlib.sha256(json.dumps(embedding).encode()).hexdigest() if embedding is not None else None
+    raw = json.dumps({
+        "tables": sorted(tables),
+        "embedding": embedding_hash,
+        "query": normalize_query(query) if mode != "vector" else None,
+        "top": top,
+        "mode": mode,
+        "options": options,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResultCache:
+    """世代番号付きの LRU キャッシュ（スレッド間で共有する）"""
+
+    def __init__(self, max_entries: int | None = None):
+        self.max_entries = (
+            max_entries if max_entries is not None
+            else int(os.environ.get("SEARCH_RESULT_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        )
+        self._entries: collections.OrderedDict[str, tuple[tuple, list[dict]]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.total_hits = 0
+        self.total_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str, generation: tuple) -> list[dict] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                if entry is not None:
+                    # インデックスが更新された後の結果は二度と使わないので捨てる
+                    del self._entries[key]
+                self.total_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.total_hits += 1
+            return [dict(r) for r in entry[1]]
+
+    def put(self, key: str, generation: tuple, results: list[dict]) -> None:
+        with self._lock:
+            self._entries[key] = (generation, [dict(r) for r in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "total_hits": self.total_hits, "total_misses": self.total_misses}
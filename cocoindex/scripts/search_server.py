@@ -0,0 +1,177 @@
+"""常駐検索サーバー
+
+search.py の起動コスト（依存パッケージのimport、.env読み込み、DB接続、
+embeddingクライアント生成、EMBEDDING_PROVIDER=local ではモデルの読み込み）を避けるため、Unixソケットで検索リクエストを受け付ける。
+ホストごとに1プロセスで、全プロジェクトのテーブルを扱う。
+
+使い方:
+  uv run python search_server.py  # hooks/session-start.sh から起動される
+
+プロトコル: 1接続につき1行のJSONリクエストを受け取り、結果を1件ずつJSON行で返したあと集計行を返す。
+  リクエスト: {"tables": ["...", ...], "queries": [{"query": "..."}, ...], "top": 5, "no_cache": false,
+              "no_result_cache": false, "options": {...}}
+  結果行:     {"index": 0, "result": {"filename": ..., "score": ..., ...}}
+  集計行:     {"ok": true, "responses": [{"query": ..., "mode": ..., "count": ...}, ...],
+              "tables": [...], "embed_ms": ..., "search_ms": ..., "cache_stats": {...}, "result_cache": {...}}
+  tables にはテーブル名のほかグロブも指定でき、サーバー側で既存テーブルに展開する。
+
+設定（~/.config/cocoindex/.env または環境変数）:
+  SEARCH_SERVER_POOL_SIZE     DB接続プールの最大接続数（デフォルト: 4）
+  SEARCH_SERVER_IDLE_TIMEOUT  この秒数リクエストがなければ終了（デフォルト: 3600）
+  SEARCH_RESULT_CACHE_MAX_ENTRIES  検索結果キャッシュの最大件数（デフォルト: 1000。0 で無効。result_cache.py）
+"""
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+from embedding_cache import EmbeddingCache
+from embeddings import get_model, get_provider, load_local_model
+from result_cache import ResultCache
+from search import SERVER_SOCKET_PATH, get_database_url, run_batch
+
+PID_FILE = SERVER_SOCKET_PATH.parent / ".pid_cocoindex_search"
+
+
+class SearchRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        def send(message: dict) -> None:
+            self.wfile.write(json.dumps(message).encode() + b"\n")
+            self.wfile.flush()
+
+        try:
+            request = json.loads(line)
+            response = self.server.handle_search(request, lambda index, result: send({"index": index, "result": result}))
+            response["ok"] = True
+        except Exception as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        send(response)
+
+
+class SearchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """DB接続プールとembeddingクライアントを保持する検索サーバー"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, pool_size: int, idle_timeout: int):
+        super().__init__(socket_path, SearchRequestHandler)
+        self.pool = ThreadedConnectionPool(1, pool_size, get_database_url())
+        self.idle_timeout = idle_timeout
+        self.last_request_at = time.monotonic()
+        self.result_cache = ResultCache()
+        self._local = threading.local()
+
+    def _cache(self) -> EmbeddingCache:
+        # SQLite接続はスレッドをまたげないため、スレッドごとに保持する
+        cache = getattr(self._local, "cache", None)
+        if cache is None:
+            cache = self._local.cache = EmbeddingCache()
+        return cache
+
+    def handle_search(self, request: dict, on_result) -> dict:
+        self.last_request_at = time.monotonic()
+        cache = None if request.get("no_cache") else self._cache()
+        if cache is not None:
+            cache.hits = cache.misses = 0
+            cache.miss_seconds = 0.0
+
+        sent = 0
+
+        def forward(index: int, result: dict) -> None:
+            nonlocal sent
+            sent += 1
+            on_result(index, result)
+
+        for attempt in range(2):
+            conn = self.pool.getconn()
+            try:
+                response = run_batch(
+                    conn, request.get("tables") or [request["table"]], request["queries"], cache, forward,
+                    top=int(request.get("top", 5)),
+                    result_cache=None if request.get("no_result_cache") else self.result_cache,
+                    **request.get("options", {}),
+                )
+                self.pool.putconn(conn)
+                break
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                # DB再起動などで切れた接続は破棄して1回だけ再試行（結果を送り始めていたら再試行しない）
+                self.pool.putconn(conn, close=True)
+                if attempt or sent:
+                    raise
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                self.pool.putconn(conn, close=bool(conn.closed))
+                raise
+
+        response["cache_stats"] = cache.stats() if cache is not None else None
+        return response
+
+    def watch_idle(self):
+        while True:
+            time.sleep(60)
+            if time.monotonic() - self.last_request_at > self.idle_timeout:
+                print("Search server idle, shutting down", flush=True)
+                self.shutdown()
+                return
+
+
+def is_server_alive() -> bool:
+    """既に別の検索サーバーがソケットで待ち受けているか"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(str(SERVER_SOCKET_PATH))
+        return True
+    except OSError:
+        return False
+
+
+def main():
+    SERVER_SOCKET_PATH.parent.mkdir(parents=True, exist_ok=True)
+    if is_server_alive():
+        print(f"Search server already running: {SERVER_SOCKET_PATH}")
+        return
+    SERVER_SOCKET_PATH.unlink(missing_ok=True)
+
+    server = SearchServer(
+        str(SERVER_SOCKET_PATH),
+        pool_size=int(os.environ.get("SEARCH_SERVER_POOL_SIZE", "4")),
+        idle_timeout=int(os.environ.get("SEARCH_SERVER_IDLE_TIMEOUT", "3600")),
+    )
+    os.chmod(SERVER_SOCKET_PATH, 0o600)
+    PID_FILE.write_text(str(os.getpid()))
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    threading.Thread(target=server.watch_idle, daemon=True).start()
+    if get_provider() == "local":
+        # 最初のクエリを待たせないよう、ローカルモデルを先に読み込む
+        threading.Thread(target=load_local_model, args=(get_model(),), daemon=True).start()
+
+    print(f"Search server started: {SERVER_SOCKET_PATH} (PID: {os.getpid()})", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.pool.closeall()
+        SERVER_SOCKET_PATH.unlink(missing_ok=True)
+        PID_FILE.unlink(missing_ok=True)
+        print("Search server stopped", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""インデックスの鮮度・カバレッジの確認
+
+作業ツリーを main.py と同じ対象・除外パターンで走査し、cocoindex の tracking テーブル
+（ファイルごとに処理した時点の mtime と内容の git blob SHA、処理日時を保持）と比較する。
+  missing   対象ファイルだがインデックスされていない
+  stale     インデックス後に内容が変わった（mtime が異なり、blob SHA も異なる）
+  touched   mtime だけが変わった（内容は同じ。次の更新で再処理されない）
+  orphaned  インデックスにあるが、作業ツリーにない（削除・除外されたファイル）
+あわせてチャンク数・テーブルサイズ・最終更新日時を表示する。ファイルを読むのは mtime が
+異なるものだけなので、走査1回分のコストで結果を信頼してよいか（再構築が必要か）を判断できる。
+
+使い方:
+  uv run python status.py --project-dir "$PWD"                       # main.py のデフォルトと同じ対象（**/*.rb）
+  uv run python status.py --project-dir "$PWD" --patterns "**/*.rb,**/*.py"
+  uv run python status.py --project-dir "$PWD" --format json
+  uv run python status.py --project-dir "$PWD" --check               # 最新でなければ終了コード 1
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from search import TABLE_SUFFIX, get_database_url, get_index_name
+
+TRACKING_SUFFIX = "__cocoindex_tracking"
+DEFAULT_LIMIT = 20
+
+
+def indexed_files(conn, tracking_table: str) -> dict[str, tuple[int | None, str | None, int | None]]:
+    """tracking テーブルのファイルごとの (mtime マイクロ秒, blob SHA, 処理日時マイクロ秒)"""
+    from psycopg2 import sql
+
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("""
+            SELECT source_key, processed_source_ordinal, encode(processed_source_fp, 'hex'), process_time_micros
+            FROM {}
+            WHERE processed_source_ordinal IS NOT NULL
+        """).format(sql.Identifier(tracking_table)))
+        rows = cur.fetchall()
+    files = {}
+    for key, ordinal, fp, processed_at in rows:
+        filename = key.get("filename") if isinstance(key, dict) else key
+        files[filename] = (ordinal, fp, processed_at)
+    return files
+
+
+def table_summary(conn, table_name: str) -> dict:
+    from psycopg2 import sql
+
+    with conn.cursor() as cur:
+        cur.execute(
+            sql.SQL("SELECT count(*), count(DISTINCT filename), pg_total_relation_size(%s) FROM {}").format(
+                sql.Identifier(table_name),
+            ),
+            (f'"{table_name}"',),
+        )
+        chunks, files, table_bytes = cur.fetchone()
+    return {"chunks": chunks, "files_with_chunks": files, "table_bytes": table_bytes}
+
+
+def compare(root: Path, walked: dict[str, int], indexed: dict[str, tuple]) -> dict[str, list[str]]:
+    """走査結果と tracking を比較して missing / stale / touched / orphaned に分ける"""
+    from file_source import git_blob_sha
+
+    result = {"missing": [], "stale": [], "touched": [], "orphaned": []}
+    for filename, mtime in walked.items():
+        entry = indexed.get(filename)
+        if entry is None:
+            result["missing"].append(filename)
+            continue
+        ordinal, fp, _ = entry
+        if ordinal == mtime:
+            continue
+        try:
+            same = fp is not None and git_blob_sha((root / filename).read_bytes()) == fp
+        except OSError:
+            same = False
+        result["touched" if same else "stale"].append(filename)
+    result["orphaned"] = [f for f in indexed if f not in walked]
+    for files in result.values():
+        files.sort()
+    return result
+
+
+def check(project_dir: str, included: list[str], excluded: list[str], name: str | None = None) -> dict:
+    import psycopg2
+
+    from file_source import FileIndex
+    from main import derive_flow_name, derive_table_name
+
+    root = Path(project_dir).resolve()
+    index_name = name or get_index_name(str(root))
+    table_name = derive_table_name(derive_flow_name(index_name))
+    tracking_table = table_name.removesuffix(TABLE_SUFFIX) + TRACKING_SUFFIX
+    status = {"project": root.name, "index_name": index_name, "table": table_name}
+
+    started = time.perf_counter()
+    file_index = FileIndex(str(root), included, excluded)
+    file_index.scan()
+    walked = file_index.snapshot()
+    status["walk_seconds"] = time.perf_counter() - started
+    status["files"] = len(walked)
+
+    conn = psycopg2.connect(get_database_url(), connect_timeout=3)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL",
+                        (f'"{table_name}"', f'"{tracking_table}"'))
+            has_table, has_tracking = cur.fetchone()
+        if not has_table or not has_tracking:
+            status["table_exists"] = False
+            return status
+        status["table_exists"] = True
+        status.update(table_summary(conn, table_name))
+        indexed = indexed_files(conn, tracking_table)
+    finally:
+        conn.close()
+
+    processed = [p for _, _, p in indexed.values() if p is not None]
+    status["indexed_files"] = len(indexed)
+    status["last_updated"] = (
+        datetime.datetime.fromtimestamp(max(processed) / 1_000_000).isoformat(timespec="seconds") if processed else None
+    )
+    status.update(compare(root, walked, indexed))
+    status["up_to_date"] = not (status["missing"] or status["stale"] or status["orphaned"])
+    return status
+
+
+def print_text(status: dict, limit: int) -> None:
+    print(f"Index: {status['index_name']} ({status['table']})")
+    print(f"Files: {status['files']} in working tree (walked in {status['walk_seconds']:.2f}s)")
+    if not status["table_exists"]:
+        print("Table: NOT FOUND")
+        return
+    print(f"Table: {status['chunks']} chunks from {status['files_with_chunks']} files, "
+          f"{status['table_bytes'] / 1024 / 1024:.1f}MB, last updated {status['last_updated'] or '-'}")
+    print(f"Indexed: {status['indexed_files']} files  missing={len(status['missing'])} stale={len(status['stale'])}"
+          f" touched={len(status['touched'])} orphaned={len(status['orphaned'])}")
+    for key in ("missing", "stale", "orphaned"):
+        files = status[key]
+        if not files:
+            continue
+        print(f"\n{key}:")
+        for filename in files[:limit]:
+            print(f"  {filename}")
+        if len(files) > limit:
+            print(f"  ... and {len(files) - limit} more")
+    print()
+    print("Status: up to date" if status["up_to_date"] else "Status: OUT OF DATE (main.py で更新してください)")
+
+
+def main():
+    from main import build_patterns
+
+    parser = argparse.ArgumentParser(description="インデックスと作業ツリーの差分（未登録・古い・削除済みファイル）を表示")
+    parser.add_argument("--project-dir", default=os.environ.get("CLAUDE_PROJECT_DIR") or os.getcwd(),
+                        help="プロジェクトディレクトリ（デフォルト: $CLAUDE_PROJECT_DIR または カレントディレクトリ）")
+    parser.add_argument("--name", default=None, help="インデックス名（main.py --name と同じ。未指定時はプロジェクトディレクトリから計算）")
+    parser.add_argument("--patterns", default="**/*.rb", help="対象ファイルパターン（main.py と同じ。カンマ区切り）")
+    parser.add_argument("--exclude", default="", help="追加除外パターン（main.py と同じ。カンマ区切り）")
+    parser.add_argument("--no-default-excludes", action="store_true", help="デフォルト除外パターンを無効化")
+    parser.add_argument("--format", choices=["text", "json"], default="text", help="出力形式")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT,
+                        help=f"text 形式で種類ごとに表示するファイル数（デフォルト: {DEFAULT_LIMIT}）")
+    parser.add_argument("--check", action="store_true", help="最新でなければ終了コード 1 で終了")
+    args = parser.parse_args()
+
+    included, excluded = build_patterns(args.patterns, args.exclude, args.no_default_excludes)
+    status = check(args.project_dir, included, excluded, args.name)
+    if args.format == "json":
+        print(json.dumps(status, ensure_ascii=False))
+    else:
+        print_text(status, args.limit)
+    if args.check and not status.get("up_to_date"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""複数プロジェクトの LiveUpdater をまとめて動かす常駐プロセス（ホストで1プロセス）
+
+プロジェクトごとに main.py --live を起動すると、それぞれが cocoindex のランタイム・DB接続・
+embedding クライアントを持つ。supervisor は1プロセスの中でプロジェクトごとのフローを動かし、
+session-start / session-end フックから Unix ソケット経由で attach / detach される。
+同じプロジェクトを開いているセッションの数を参照数として数え、0 になったら停止する。
+
+使い方:
+  uv run python supervisor.py attach --project-dir "$PWD" --name <index_name>  # 未起動なら supervisor を起動
+  uv run python supervisor.py detach --name <index_name>  # 残りの接続中プロジェクト数を表示（停止は待たない）
+  uv run python supervisor.py status                      # 接続中プロジェクトの一覧（JSON）
+  uv run python supervisor.py serve                       # フォアグラウンドで起動
+
+プロトコル: 1接続につき1行のJSONリクエストを受け取り、1行のJSONレスポンスを返す。
+  {"command": "attach", "project_dir": "...", "name": "...", "patterns": "**/*.rb", "exclude": "", "no_default_excludes": false}
+  {"command": "detach", "name": "..."}
+  {"command": "status"}
+
+設定（~/.config/cocoindex/.env または環境変数）:
+  SUPERVISOR_IDLE_TIMEOUT  接続中のプロジェクトがなくなってから終了するまでの秒数（デフォルト: 300）
+  LIVE_UPDATE_MODE         watch / poll（main.py --live と同じ）
+"""
+import argparse
+import datetime
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+CONFIG_DIR = Path.home() / ".config" / "cocoindex"
+load_dotenv(dotenv_path=CONFIG_DIR / ".env")
+
+SOCKET_PATH = Path.home() / ".claude" / "tmp" / "cocoindex-supervisor.sock"
+PID_FILE = SOCKET_PATH.parent / ".pid_cocoindex_supervisor"
+LOCK_FILE = SOCKET_PATH.parent / ".lock_cocoindex_supervisor"
+LOG_FILE = "/tmp/cocoindex-live-updater.log"
+REQUEST_TIMEOUT = 60
+START_TIMEOUT = 60
+STOP_TIMEOUT = 60
+
+
+def log(message: str) -> None:
+    print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] supervisor: {message}", flush=True)
+
+
+class Project:
+    """supervisor 内で動かす1プロジェクト分のフローと更新スレッド"""
+
+    def __init__(self, name: str, source_path: str, included: list[str], excluded: list[str]):
+        self.name = name
+        self.source_path = source_path
+        self.included = included
+        self.excluded = excluded
+        self.refs = 0
+        self.state = "starting"
+        self.error: str | None = None
+        self.started_at = time.time()
+        self.flow = None
+        self.updater = None
+        self.stop_event = threading.Event()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"live-{name}", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def _run(self) -> None:
+        import cocoindex
+
+        import chunk_profiles
+        import main
+
+        try:
+            mode = main.get_live_update_mode()
+            self.flow, flow_name = main.create_flow(
+                self.source_path, self.name, self.included, self.excluded,
+                live=mode == "poll", profiles=chunk_profiles.load_profiles(),
+            )
+            self.flow.setup()
+            self.state = "running"
+            if mode == "watch":
+                main.run_watch(self.flow, flow_name, self.source_path, self.included, self.excluded, self.stop_event)
+            else:
+                self.updater = cocoindex.FlowLiveUpdater(
+                    self.flow, cocoindex.FlowLiveUpdaterOptions(live_mode=True, print_stats=True),
+                )
+                self.updater.start()
+                if self.stop_event.is_set():
+                    self.updater.abort()
+                self.updater.wait()
+            self.state = "stopped"
+        except Exception as e:
+            self.state = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            log(f"{self.name} failed: {self.error}")
+
+    def stop(self, timeout: float | None = STOP_TIMEOUT) -> bool:
+        """更新スレッドを止めてフローを閉じる（timeout 以内にスレッドが終わらなければ何も閉じずに False）
+
+        closed はフローを閉じた後にだけセットされ、同じフロー名を作り直してよいことを表す。
+        """
+        import file_source
+
+        if self.closed.is_set():
+            return True
+        self.stop_event.set()
+        if self.updater is not None:
+            self.updater.abort()
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            return False
+        if self.flow is not None:
+            self.flow.close()
+        file_source.release_file_index(self.source_path, self.included, self.excluded)
+        self.closed.set()
+        return True
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "source_path": self.source_path,
+            "refs": self.refs,
+            "state": self.state,
+            "error": self.error,
+            "uptime_seconds": round(time.time() - self.started_at),
+        }
+
+
+class Supervisor:
+    def __init__(self, idle_timeout: float):
+        import cocoindex
+
+        cocoindex.init()
+        self.projects: dict[str, Project] = {}
+        self.stopping: dict[str, Project] = {}
+        self.lock = threading.Lock()
+        self.idle_timeout = idle_timeout
+        self.idle_since: float | None = time.monotonic()
+
+    def attach(self, request: dict) -> dict:
+        name = request["name"]
+        source_path = str(Path(request["project_dir"]).resolve())
+        refs = 0
+        while True:
+            with self.lock:
+                stopping = self.stopping.get(name)
+                failed = None
+                if stopping is None:
+                    project = self.projects.get(name)
+                    if project is not None and project.state in ("failed", "stopped"):
+                        # 失敗したプロジェクトは閉じてから作り直す（参照数は引き継ぐ）
+                        refs = project.refs
+                        del self.projects[name]
+                        self.stopping[name] = failed = project
+                    else:
+                        return self._attach_locked(name, source_path, project, refs, request)
+            if failed is not None:
+                self._stop_project(name, failed)
+                continue
+            # 同じフロー名を作り直すため、ロックを持たずに停止中のフローが閉じられるのを待ってから確認し直す
+            if not stopping.closed.wait(STOP_TIMEOUT):
+                raise RuntimeError(f"{name}: 前のフローが {STOP_TIMEOUT} 秒以内に停止しませんでした")
+
+    def _attach_locked(self, name: str, source_path: str, project: Project | None, refs: int, request: dict) -> dict:
+        import main
+
+        if project is None:
+            included, excluded = main.build_patterns(
+                request.get("patterns") or "**/*.rb",
+                request.get("exclude") or "",
+                bool(request.get("no_default_excludes")),
+            )
+            project = Project(name, source_path, included, excluded)
+            self.projects[name] = project
+            project.start()
+            log(f"attached {name} ({source_path})")
+        # refs は作り直す前のプロジェクトから引き継ぐ参照数
+        project.refs += refs + 1
+        self.idle_since = None
+        return {"project": project.describe(), "attached": len(self.projects)}
+
+    def detach(self, request: dict) -> dict:
+        """参照数を減らしてすぐに返す（0 になったプロジェクトの停止はバックグラウンドで行う）
+
+        session-end フックのタイムアウトは短いため、更新スレッドの終了を待たない。
+        停止中に同じプロジェクトが attach されたら、attach 側が停止の完了を待つ。
+        """
+        name = request["name"]
+        with self.lock:
+            project = self.projects.get(name)
+            if project is not None:
+                project.refs -= 1
+                if project.refs <= 0:
+                    del self.projects[name]
+                    self.stopping[name] = project
+                else:
+                    project = None
+            if not self.projects:
+                self.idle_since = time.monotonic()
+            attached = len(self.projects)
+        if project is not None:
+            threading.Thread(target=self._stop_project, args=(name, project), name=f"stop-{name}",
+                             daemon=True).start()
+        return {"attached": attached}
+
+    def _stop_project(self, name: str, project: Project) -> None:
+        if not project.stop():
+            # 閉じるまで stopping に残し、同じプロジェクトの attach にはフローを作り直させない
+            log(f"{name} did not stop within {STOP_TIMEOUT}s; waiting for the update thread")
+            project.stop(timeout=None)
+        with self.lock:
+            if self.stopping.get(name) is project:
+                del self.stopping[name]
+        log(f"detached {name}")
+
+    def status(self, request: dict) -> dict:
+        with self.lock:
+            return {"pid": os.getpid(), "projects": [p.describe() for p in self.projects.values()]}
+
+    def is_idle(self) -> bool:
+        with self.lock:
+            return self.idle_since is not None and time.monotonic() - self.idle_since > self.idle_timeout
+
+    def stop_all(self) -> None:
+        with self.lock:
+            projects = list(self.projects.values())
+            self.projects.clear()
+            stopping = list(self.stopping.values())
+        for project in projects:
+            project.stop()
+        for project in stopping:
+            project.closed.wait(STOP_TIMEOUT)
+
+
+def serve() -> None:
+    import fcntl
+    import socketserver
+
+    SOCKET_PATH.parent.mkdir(parents=True, exist_ok=True)
+    lock = open(LOCK_FILE, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        log("already running")
+        return
+
+    supervisor = Supervisor(idle_timeout=float(os.environ.get("SUPERVISOR_IDLE_TIMEOUT", "300")))
+    commands = {"attach": supervisor.attach, "detach": supervisor.detach, "status": supervisor.status}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                return
+            try:
+                request = json.loads(line)
+                response = commands[request["command"]](request)
+                response["ok"] = True
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    SOCKET_PATH.unlink(missing_ok=True)
+    server = Server(str(SOCKET_PATH), Handler)
+    os.chmod(SOCKET_PATH, 0o600)
+    PID_FILE.write_text(str(os.getpid()))
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def watch_idle():
+        while True:
+            time.sleep(10)
+            if supervisor.is_idle():
+                log("no projects attached, shutting down")
+                server.shutdown()
+                return
+
+    import signal
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    threading.Thread(target=watch_idle, daemon=True).start()
+
+    log(f"started: {SOCKET_PATH} (PID: {os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        SOCKET_PATH.unlink(missing_ok=True)
+        PID_FILE.unlink(missing_ok=True)
+        supervisor.stop_all()
+        log("stopped")
+
+
+def send(request: dict, timeout: float = REQUEST_TIMEOUT) -> dict | None:
+    """supervisor にリクエストを送る（未起動なら None、エラー時は終了）"""
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(str(SOCKET_PATH))
+    except OSError:
+        return None
+    with sock, sock.makefile("rb") as f:
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        line = f.readline()
+    if not line:
+        sys.exit("supervisor error: connection closed")
+    response = json.loads(line)
+    if not response.get("ok"):
+        sys.exit(f"supervisor error: {response.get('error')}")
+    return response
+
+
+def spawn() -> None:
+    """supervisor をバックグラウンドで起動し、ソケットが使えるようになるまで待つ"""
+    with open(LOG_FILE, "a") as out:
+        subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "serve"],
+            cwd=Path(__file__).resolve().parent,
+            stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if send({"command": "status"}, timeout=1) is not None:
+            return
+        time.sleep(0.2)
+    sys.exit("supervisor error: failed to start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数プロジェクトの LiveUpdater をまとめて動かす常駐プロセス")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("serve", help="supervisor をフォアグラウンドで起動")
+    attach = subparsers.add_parser("attach", help="プロジェクトの LiveUpdater を開始（参照数 +1）")
+    attach.add_argument("--project-dir", required=True, help="インデックス対象ディレクトリ（絶対パス）")
+    attach.add_argument("--name", required=True, help="インデックス名（main.py --name と同じ）")
+    attach.add_argument("--patterns", default="**/*.rb", help="対象ファイルパターン（カンマ区切り）")
+    attach.add_argument("--exclude", default="", help="追加除外パターン（カンマ区切り）")
+    attach.add_argument("--no-default-excludes", action="store_true", help="デフォルト除外パターンを無効化")
+    detach = subparsers.add_parser("detach", help="プロジェクトの参照数 -1（0 になったら停止）")
+    detach.add_argument("--name", required=True, help="インデックス名")
+    subparsers.add_parser("status", help="接続中プロジェクトの一覧")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve()
+    elif args.command == "attach":
+        request = {
+            "command": "attach",
+            "project_dir": args.project_dir,
+            "name": args.name,
+            "patterns": args.patterns,
+            "exclude": args.exclude,
+            "no_default_excludes": args.no_default_excludes,
+        }
+        response = send(request)
+        if response is None:
+            spawn()
+            response = send(request)
+        if response is None:
+            sys.exit("supervisor error: not running")
+        print(json.dumps(response["project"], ensure_ascii=False))
+    elif args.command == "detach":
+        response = send({"command": "detach", "name": args.name})
+        print(response["attached"] if response is not None else 0)
+    else:
+        response = send({"command": "status"})
+        print(json.dumps(response or {"projects": []}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()